@@ -20,10 +20,11 @@ from ec4vis.datasource.page import DATASOURCE_PAGE_REGISTRY, EVT_DATASOURCE_CHAN
 from ec4vis.datasource.add_dialog import AddDatasourceDialog
 from ec4vis.inspector.page import INSPECTOR_PAGE_REGISTRY
 from ec4vis.inspector.datasource.page import DatasourceInspectorPage
-from ec4vis.pipeline import PipelineTree, UpdateEvent, PIPELINE_NODE_REGISTRY
+from ec4vis.pipeline import PipelineTree, UpdateEvent, PIPELINE_NODE_REGISTRY, set_dialogs_enabled, set_result_dispatcher, set_update_timer
 from ec4vis.pipeline.add_dialog import AddPipelineNodeDialog
 from ec4vis.plugins import PluginLoader
 from ec4vis.registry import Registry
+from ec4vis.utils.pool import start_process_pool, stop_process_pool
 from ec4vis.visualizer.page import VISUALIZER_PAGE_REGISTRY
 from ec4vis.version import VERSION
 
@@ -50,6 +51,12 @@ class BrowserApp(wx.App):
     def OnInit(self):
         """Integrated initialization hook.
         """
+        # results of asynchronous pipeline requests come back on the GUI thread
+        set_result_dispatcher(wx.CallAfter)
+        # status changes in bursts, e.g. from sliders, are coalesced per frame
+        set_update_timer(wx.CallLater)
+        # nodes may show progress dialogs on the GUI thread
+        set_dialogs_enabled(True)
         # initialize UI stuff
         self.init_ui()
         # initialize plugins
@@ -482,7 +489,10 @@ class BrowserApp(wx.App):
 
 
 if __name__=='__main__':
+    # loader workers are forked before the GUI starts threads.
+    start_process_pool()
     app = BrowserApp(0)
     debug('Running MainLoop()')
     app.MainLoop()
+    stop_process_pool()
     debug('Exit.')
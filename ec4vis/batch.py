@@ -0,0 +1,390 @@
+# coding: utf-8
+"""ec4vis.batch --- Headless batch rendering of frame sequences.
+
+Loads a pipeline saved by the browser, points its datasource at a
+Spatiocyte log or an HDF5 bundle, and renders every frame of a 3D
+visualizer offscreen, to numbered PNG files or a movie. Plugins still
+import wx, but no window or dialog is opened: loaders show progress
+dialogs only if the browser enabled them (see can_show_dialogs() in
+ec4vis.pipeline). With --jobs, the frame range is split into contiguous
+chunks rendered by worker processes, each with its own pipeline.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+import vtk
+
+# this allows module-wise execution
+try:
+    import ec4vis
+except ImportError:
+    import sys, os
+    p = os.path.abspath(__file__); sys.path.insert(0, p[:p.rindex(os.sep+'ec4vis')])
+
+from ec4vis.datasource import Datasource
+from ec4vis.logger import debug, info, warning, getLogger, DEBUG, INFO
+from ec4vis.pipeline import PipelineTree, UpdateEvent
+from ec4vis.pipeline.specs import NumberOfItemsSpec
+from ec4vis.plugins import PluginLoader
+from ec4vis.registry import Registry
+from ec4vis.utils.pool import map_in_pool, start_process_pool, stop_process_pool
+from ec4vis.visualizer.vtk3d import Vtk3dVisualizerNode
+
+
+DEFAULT_IMAGE_PATTERN = 'frame%05d.png'
+DEFAULT_SIZE = (800, 600)
+# movie writers by file extension, the first available is used.
+MOVIE_WRITERS = {
+    '.ogv': ['vtkOggTheoraWriter'],
+    '.avi': ['vtkFFMPEGWriter', 'vtkAVIWriter'],
+    '.mp4': ['vtkFFMPEGWriter'],
+    }
+
+
+def load_plugins():
+    """Imports plugins, registering their pipeline nodes.
+
+    Plugins import wx, which must be installed, though no wx.App is made.
+    """
+    for mod_fullpath, loaded in PluginLoader().load_iterative():
+        if not loaded:
+            warning('Failed to load plugin %s' % mod_fullpath)
+
+
+def load_pipeline(registry_home=None):
+    """Loads the pipeline saved by the browser in the registry.
+    """
+    registry = Registry(registry_home)
+    try:
+        tree_info = registry.load_section('pipeline').get('tree', None)
+        if tree_info is None:
+            raise ValueError('No pipeline saved in %s' % registry.registry_path)
+        tree = PipelineTree(datasource=Datasource())
+        tree.restore(tree_info)
+    finally:
+        registry.close()
+    return tree
+
+
+def path_to_uri(path):
+    """Returns file uri for path, as the filesystem datasource makes.
+
+    >>> path_to_uri('/data/VisualLog.dat')
+    'file:///data/VisualLog.dat'
+
+    """
+    return 'file://' + os.path.abspath(path)
+
+
+def find_visualizer(tree, name=None):
+    """Returns the first 3D visualizer node in tree, or one named name.
+    """
+    for node in tree.root.descendants:
+        if not isinstance(node, Vtk3dVisualizerNode):
+            continue
+        if name is None or node.name == name:
+            return node
+    raise ValueError('No 3D visualizer%s in the pipeline.'
+                     % ('' if name is None else ' named %s' % name))
+
+
+def find_selector(node):
+    """Returns the nearest ancestor selecting frames by index_cursor.
+    """
+    for ancestor in node.ancestors:
+        if hasattr(ancestor, 'index_cursor'):
+            return ancestor
+    return None
+
+
+def count_frames(node):
+    """Returns the number of frames the visualizer node can show.
+    """
+    if hasattr(node, 'index'):
+        count = node.parent.request_data(NumberOfItemsSpec)
+    else:
+        selector = find_selector(node)
+        count = 1 if selector is None else selector.n_data
+    return count or 0
+
+
+def show_frame(node, index):
+    """Updates the visualizer node to show the frame at index.
+    """
+    if hasattr(node, 'index'):
+        node.index = index
+        node.status_changed()
+        return
+    selector = find_selector(node)
+    if selector is None:
+        node.status_changed()
+    else:
+        selector.index_cursor = index
+        selector.notify_changed('index_cursor')
+
+
+def create_render_window(node, size=DEFAULT_SIZE):
+    """Returns an offscreen render window for the renderer of node.
+    """
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(*size)
+    render_window.AddRenderer(node.renderer)
+    return render_window
+
+
+def create_movie_writer(filename):
+    """Returns a vtk movie writer for filename, by its extension.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    for class_name in MOVIE_WRITERS.get(ext, []):
+        writer_class = getattr(vtk, class_name, None)
+        if writer_class is not None:
+            writer = writer_class()
+            writer.SetFileName(filename)
+            return writer
+    raise ValueError('No movie writer available for %s' % filename)
+
+
+def split_indices(indices, n_chunks):
+    """Splits indices into at most n_chunks contiguous chunks.
+
+    Contiguous chunks keep each worker reading frames sequentially,
+    which is what the readers and their prefetchers are tuned for.
+
+    >>> split_indices(range(10), 3)
+    [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    >>> split_indices(range(2), 4)
+    [[0], [1]]
+
+    """
+    indices = list(indices)
+    n_chunks = max(min(n_chunks, len(indices)), 1)
+    size, rest = divmod(len(indices), n_chunks)
+    chunks = []
+    start = 0
+    for i in range(n_chunks):
+        stop = start + size + (1 if i < rest else 0)
+        chunks.append(indices[start:stop])
+        start = stop
+    return [chunk for chunk in chunks if chunk]
+
+
+class FrameRenderer(object):
+    """Renders frames of a visualizer node offscreen.
+    """
+    def __init__(self, node, size=DEFAULT_SIZE):
+        """Initializer.
+        """
+        self.node = node
+        self.render_window = create_render_window(node, size)
+        self.image_filter = vtk.vtkWindowToImageFilter()
+        self.image_filter.SetInput(self.render_window)
+
+    def render(self, index):
+        """Renders the frame at index. Returns the image filter.
+        """
+        show_frame(self.node, index)
+        self.render_window.Render()
+        self.image_filter.Modified()
+        self.image_filter.Update()
+        return self.image_filter
+
+    def write_images(self, indices, pattern=DEFAULT_IMAGE_PATTERN):
+        """Writes frames at indices to PNG files. Returns their names.
+        """
+        writer = vtk.vtkPNGWriter()
+        writer.SetInputConnection(self.image_filter.GetOutputPort())
+        filenames = []
+        for index in indices:
+            self.render(index)
+            filename = pattern % index
+            writer.SetFileName(filename)
+            writer.Write()
+            debug('wrote %s' % filename)
+            filenames.append(filename)
+        return filenames
+
+    def write_movie(self, indices, filename, rate=None):
+        """Writes frames at indices to a movie file.
+        """
+        writer = create_movie_writer(filename)
+        if rate is not None:
+            writer.SetRate(rate)
+        writer.SetInputConnection(self.image_filter.GetOutputPort())
+        started = False
+        for index in indices:
+            self.render(index)
+            if not started:
+                # the frame size is taken at Start().
+                writer.Start()
+                started = True
+            writer.Write()
+            debug('wrote frame %d' % index)
+        if started:
+            writer.End()
+
+
+def write_movie_from_images(filenames, filename, rate=None):
+    """Writes PNG files, in the given order, to a movie file.
+    """
+    writer = create_movie_writer(filename)
+    if rate is not None:
+        writer.SetRate(rate)
+    reader = vtk.vtkPNGReader()
+    writer.SetInputConnection(reader.GetOutputPort())
+    started = False
+    for image_filename in filenames:
+        reader.SetFileName(image_filename)
+        reader.Update()
+        if not started:
+            writer.Start()
+            started = True
+        writer.Write()
+    if started:
+        writer.End()
+
+
+def setup_pipeline(uri, registry_home=None, node_name=None):
+    """Returns the pipeline saved in the registry, reading uri, and its
+    3D visualizer node.
+    """
+    load_plugins()
+    tree = load_pipeline(registry_home)
+    tree.root.datasource.uri = uri
+    node = find_visualizer(tree, node_name)
+    return (tree, node)
+
+
+def finalize_pipeline(tree):
+    """Releases file handles and workers held by the nodes of tree.
+    """
+    for descendant in tree.root.descendants:
+        descendant.finalize()
+
+
+def render_chunk(args):
+    """Renders a chunk of frames to PNG files in a worker process.
+
+    args is a tuple of (uri, registry_home, node_name, size, indices,
+    pattern). The worker builds its own pipeline, readers and render
+    window. Returns the names of the files written.
+    """
+    uri, registry_home, node_name, size, indices, pattern = args
+    tree, node = setup_pipeline(uri, registry_home, node_name)
+    try:
+        tree.root.propagate_down(UpdateEvent(None))
+        return FrameRenderer(node, size).write_images(indices, pattern)
+    finally:
+        finalize_pipeline(tree)
+
+
+def render_in_pool(uri, registry_home, node_name, size, indices, pattern,
+                   jobs):
+    """Renders frames at indices to PNG files in jobs chunks, in the
+    worker processes of start_process_pool().
+
+    Returns the names of the files written, in the order of indices.
+    """
+    chunks = split_indices(indices, jobs)
+    info('Rendering in %d processes' % len(chunks))
+    results = map_in_pool(
+        render_chunk,
+        [(uri, registry_home, node_name, size, chunk, pattern)
+         for chunk in chunks])
+    filenames = []
+    for chunk_filenames in results:
+        filenames.extend(chunk_filenames)
+    return filenames
+
+
+def parse_args(args):
+    args_parser = ArgumentParser(
+        description='Renders frames of a saved pipeline offscreen, '
+        'without opening windows or dialogs (wx must still be installed).')
+    args_parser.add_argument(
+        'datasource', help='Spatiocyte log, HDF5 file or HDF5 bundle directory')
+    args_parser.add_argument(
+        '-o', '--output', default=DEFAULT_IMAGE_PATTERN,
+        help='printf-style PNG file pattern, or a movie file '
+        '(.ogv, .avi, .mp4) (default: %(default)s)')
+    args_parser.add_argument(
+        '--registry', default=None, dest='registry_home',
+        help='directory holding the .ec4vis registry (default: $HOME)')
+    args_parser.add_argument(
+        '--node', default=None,
+        help='name of the visualizer node (default: the first found)')
+    args_parser.add_argument('--start', type=int, default=0)
+    args_parser.add_argument('--stop', type=int, default=None)
+    args_parser.add_argument('--step', type=int, default=1)
+    args_parser.add_argument(
+        '--size', type=int, nargs=2, default=list(DEFAULT_SIZE),
+        metavar=('WIDTH', 'HEIGHT'))
+    args_parser.add_argument(
+        '--rate', type=int, default=None, help='frames per second of a movie')
+    args_parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='number of worker processes (default: %(default)s)')
+    args_parser.add_argument('-D', help='debug mode', action='store_true', dest='debug')
+    return args_parser.parse_args(args)
+
+
+def render(options, uri, size, is_movie):
+    """Renders frames as main() is told by options.
+    """
+    tree, node = setup_pipeline(uri, options.registry_home, options.node)
+    # the first update brings the number of frames.
+    tree.root.propagate_down(UpdateEvent(None))
+    stop = options.stop
+    if stop is None:
+        stop = count_frames(node)
+    indices = range(options.start, stop, options.step)
+    info('Rendering %d frames of %s' % (len(indices), node))
+    if options.jobs <= 1:
+        try:
+            renderer = FrameRenderer(node, size)
+            if is_movie:
+                renderer.write_movie(indices, options.output, options.rate)
+            else:
+                renderer.write_images(indices, options.output)
+        finally:
+            finalize_pipeline(tree)
+        return
+    # workers build their own pipelines.
+    finalize_pipeline(tree)
+    if not is_movie:
+        render_in_pool(uri, options.registry_home, options.node, size,
+                       indices, options.output, options.jobs)
+        return
+    # movie writers are sequential, so workers render images which are
+    # encoded here in order.
+    tmpdir = tempfile.mkdtemp(prefix='ec4vis-frames-')
+    try:
+        filenames = render_in_pool(
+            uri, options.registry_home, options.node, size, indices,
+            os.path.join(tmpdir, DEFAULT_IMAGE_PATTERN), options.jobs)
+        write_movie_from_images(filenames, options.output, options.rate)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main(args=()):
+    options = parse_args(args)
+    getLogger().setLevel(DEBUG if options.debug else INFO)
+    uri = path_to_uri(options.datasource)
+    size = tuple(options.size)
+    is_movie = os.path.splitext(options.output)[1].lower() in MOVIE_WRITERS
+    # workers are forked before nodes start threads, e.g. prefetchers.
+    start_process_pool(options.jobs if options.jobs > 1 else None)
+    try:
+        render(options, uri, size, is_movie)
+    finally:
+        stop_process_pool()
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
@@ -1,7 +1,13 @@
 # coding: utf-8
 """pipeline.py --- Represents pipeline.
 """
+import copy
 import sys
+import time
+import threading
+import weakref
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 
 # this allows module-wise execution
@@ -11,7 +17,8 @@ except ImportError:
     import sys, os
     p = os.path.abspath(__file__); sys.path.insert(0, p[:p.rindex(os.sep+'ec4vis')])
 
-from ec4vis.logger import debug, info, log_call, logger, DEBUG
+from ec4vis.logger import debug, info, log_call, logger, warning, DEBUG
+from ec4vis.utils.cache import LRUCache
 
 
 # pipeline node registry
@@ -27,6 +34,543 @@ def register_pipeline_node(node_class, name=None):
     debug('Registered pipeline node %s as %s' %(node_class.__name__, name))
 
 
+# callable to deliver results of asynchronous requests, e.g. wx.CallAfter.
+# None runs requests synchronously and calls back immediately.
+RESULT_DISPATCHER = None
+# threads serving asynchronous requests. requests are served one at a
+# time, and nodes lock what the GUI thread may use meanwhile themselves.
+ASYNC_WORKERS = 1
+_async_pool = None
+# if nodes may open dialogs, e.g. progress dialogs, on the GUI thread.
+DIALOGS_ENABLED = False
+# parameters of nodes snapshot for the request served by this thread.
+_request_parameters = threading.local()
+
+
+def set_result_dispatcher(dispatcher):
+    """Sets how results of asynchronous requests are delivered.
+
+    dispatcher(func, *args) should call func(*args) later on the GUI
+    thread; wx.CallAfter does. Requests run on a worker thread while a
+    dispatcher is set.
+    """
+    global RESULT_DISPATCHER
+    RESULT_DISPATCHER = dispatcher
+
+
+def set_dialogs_enabled(flag):
+    """Sets if nodes may open dialogs. The wx application enables them.
+    """
+    global DIALOGS_ENABLED
+    DIALOGS_ENABLED = flag
+
+
+def can_show_dialogs():
+    """Returns if nodes may show dialogs, through ProgressReporter.
+
+    Dialogs are never shown without an app, e.g. in batch rendering.
+
+    >>> can_show_dialogs()
+    False
+
+    """
+    return DIALOGS_ENABLED
+
+
+def call_on_gui_thread(func, *args):
+    """Calls func(*args) on the GUI thread, now if this is the GUI thread.
+
+    Calls from other threads are passed to RESULT_DISPATCHER, and made
+    in the order they are passed.
+    """
+    if (RESULT_DISPATCHER is None
+        or isinstance(threading.current_thread(), threading._MainThread)):
+        func(*args)
+    else:
+        RESULT_DISPATCHER(func, *args)
+
+
+class ProgressReporter(object):
+    """Shows progress of a request in a dialog on the GUI thread.
+
+    create_dialog() is called on the GUI thread to open a dialog, such
+    as wx.ProgressDialog, whose Update(count) returns (continue, skip).
+    The reporter is called as reporter(count) from any thread, e.g. by
+    map_in_pool() on the worker thread, and returns False once the
+    dialog has been cancelled. close() closes the dialog.
+
+    >>> class Dialog(object):
+    ...     def Update(self, count):
+    ...         print 'update', count
+    ...         return (count < 2, False)
+    ...     def Destroy(self):
+    ...         print 'destroyed'
+    >>> progress = ProgressReporter(Dialog)
+    >>> progress(1)
+    update 1
+    True
+    >>> progress(2)
+    update 2
+    False
+    >>> progress.close()
+    destroyed
+
+    """
+    def __init__(self, create_dialog):
+        """Initializer.
+        """
+        self._create_dialog = create_dialog
+        self._dialog = None
+        self._closed = False
+        self._cancelled = False
+        call_on_gui_thread(self._open)
+
+    def __call__(self, count):
+        call_on_gui_thread(self._update, count)
+        return not self._cancelled
+
+    def close(self):
+        call_on_gui_thread(self._close)
+
+    def _open(self):
+        if not self._closed:
+            self._dialog = self._create_dialog()
+
+    def _update(self, count):
+        if self._dialog is not None and not self._dialog.Update(count)[0]:
+            self._cancelled = True
+
+    def _close(self):
+        self._closed = True
+        if self._dialog is not None:
+            self._dialog.Destroy()
+            self._dialog = None
+
+
+class PipelineFuture(object):
+    """Handle of a result being computed by run_async().
+
+    >>> future = PipelineFuture()
+    >>> future.add_done_callback(lambda f: sys.stdout.write('%s\\n' % f.result()))
+    >>> future.done()
+    False
+    >>> future.set_result(42)
+    42
+    >>> future.done(), future.result()
+    (True, 42)
+    >>> future = PipelineFuture()
+    >>> future.cancel()
+    True
+    >>> future.set_result(42) # dropped
+    >>> future.result() # None
+
+    """
+    def __init__(self):
+        """Initializer.
+        """
+        self._condition = threading.Condition()
+        self._done = False
+        self._cancelled = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """Returns if the result (or an exception) is set, or cancelled.
+        """
+        return self._done or self._cancelled
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """Cancels the request. Returns false if it has been done already.
+
+        A request not started yet is skipped, and callbacks of a cancelled
+        request are never called.
+        """
+        with self._condition:
+            if self._done:
+                return False
+            self._cancelled = True
+            self._condition.notify_all()
+            return True
+
+    def result(self, timeout=None):
+        """Waits for and returns the result, or raises the exception.
+
+        Returns None if cancelled or timed out.
+        """
+        with self._condition:
+            if not self.done():
+                self._condition.wait(timeout)
+            if self._exception is not None:
+                raise self._exception
+            return self._result
+
+    def exception(self, timeout=None):
+        """Waits for and returns the exception raised, or None.
+        """
+        with self._condition:
+            if not self.done():
+                self._condition.wait(timeout)
+            return self._exception
+
+    def add_done_callback(self, callback):
+        """Calls callback(future) once the result is set.
+        """
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        self._dispatch(callback)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exception):
+        self._finish(None, exception)
+
+    def _finish(self, result, exception):
+        with self._condition:
+            if self._cancelled:
+                return
+            self._result = result
+            self._exception = exception
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+        for callback in callbacks:
+            self._dispatch(callback)
+
+    def _dispatch(self, callback):
+        if RESULT_DISPATCHER is None:
+            self._deliver(callback)
+        else:
+            RESULT_DISPATCHER(self._deliver, callback)
+
+    def _deliver(self, callback):
+        # the request may be cancelled while the result is on its way.
+        if not self._cancelled:
+            callback(self)
+
+
+def _run_future(future, func, args, kwargs):
+    """Runs func for future, unless it has been cancelled.
+    """
+    if future.cancelled():
+        return
+    try:
+        result = func(*args, **kwargs)
+    except Exception, e:
+        warning('Asynchronous request failed: %s' % str(e))
+        future.set_exception(e)
+    else:
+        future.set_result(result)
+
+
+def run_async(func, *args, **kwargs):
+    """Calls func(*args, **kwargs) on the worker thread. Returns a future.
+
+    Runs func immediately if no result dispatcher is set. func must not
+    use wx, nor wait for the GUI thread; callbacks of the future run on
+    the GUI thread and may. See also PipelineNode.run_async(), which
+    snapshots parameters of nodes for func.
+
+    >>> future = run_async(pow, 2, 10)
+    >>> future.done(), future.result()
+    (True, 1024)
+
+    """
+    global _async_pool
+    future = PipelineFuture()
+    if RESULT_DISPATCHER is None:
+        _run_future(future, func, args, kwargs)
+    else:
+        if _async_pool is None:
+            _async_pool = ThreadPool(ASYNC_WORKERS)
+        _async_pool.apply_async(_run_future, (future, func, args, kwargs))
+    return future
+
+
+def _call_with_parameters(snapshot, func, args, kwargs):
+    """Calls func(*args, **kwargs) seeing parameters of nodes in snapshot.
+    """
+    previous = getattr(_request_parameters, 'snapshot', None)
+    _request_parameters.snapshot = snapshot
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _request_parameters.snapshot = previous
+
+
+def parameters_outdated():
+    """Returns if parameters snapshot for the request served by this
+    thread have changed since, so that its results must not be cached.
+
+    >>> class ScalingNode(PipelineNode):
+    ...     SPEC_DEPENDENCIES = {UriSpec: ['scale']}
+    ...     scale = 1
+    >>> node = ScalingNode()
+    >>> snapshot = node.snapshot_parameters()
+    >>> _call_with_parameters(snapshot, parameters_outdated, (), {})
+    False
+    >>> node.scale = 2
+    >>> _call_with_parameters(snapshot, parameters_outdated, (), {})
+    True
+
+    """
+    snapshot = getattr(_request_parameters, 'snapshot', None)
+    if snapshot is None:
+        return False
+    for node, params in snapshot.items():
+        for name, value in params.items():
+            if getattr(node, name) != value:
+                return True
+    return False
+
+
+def estimate_nbytes(value):
+    """Estimates memory held by a result, for ResultCache.
+
+    Uses nbytes of the value if it has one, as numpy arrays and particle
+    spaces do.
+
+    >>> import numpy
+    >>> estimate_nbytes(numpy.zeros(10))
+    80
+    >>> estimate_nbytes('abc') > 0
+    True
+
+    """
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, (int, long)):
+        return nbytes
+    return sys.getsizeof(value)
+
+
+# marks a result not found in ResultCache.
+_MISSING = object()
+
+
+class ResultCache(object):
+    """Results of request_data() kept by node, spec and parameters.
+
+    Results are evicted least recently used first to keep their
+    estimated sizes within max_bytes. Results of a node are invalidated
+    when an UpdateEvent passes it, see PipelineNode.propagate_down().
+
+    Each invalidation starts a new generation of results. A result is
+    put with the generation its request started in, so that a result
+    computed on the worker thread while the GUI thread invalidated it
+    is never returned.
+
+    Results are kept by id of the node, not the node itself, and are
+    dropped when the node is freed or forgotten.
+
+    >>> cache = ResultCache(max_bytes=1024)
+    >>> node = PipelineNode()
+    >>> cache.put(node, UriSpec, dict(index=1), 'foo')
+    >>> cache.get(node, UriSpec, dict(index=1))
+    (True, 'foo')
+    >>> cache.get(node, UriSpec, dict(index=2))
+    (False, None)
+    >>> cache.invalidate(node)
+    >>> cache.get(node, UriSpec, dict(index=1))
+    (False, None)
+    >>> generation = cache.generation(node, UriSpec)
+    >>> cache.invalidate(node, [UriSpec])
+    >>> cache.put(node, UriSpec, dict(index=1), 'stale', generation)
+    >>> cache.get(node, UriSpec, dict(index=1))
+    (False, None)
+    >>> cache.put(node, UriSpec, dict(index=1), 'foo')
+    >>> len(cache._cache)
+    1
+    >>> del node
+    >>> len(cache._cache), cache._node_refs
+    (0, {})
+
+    """
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """Initializer.
+        """
+        self._cache = LRUCache(max_bytes=max_bytes, sizeof=estimate_nbytes)
+        # id of node -> weak reference to it, forgetting it when freed
+        self._node_refs = {}
+        # id of node -> generation, and (id of node, spec) -> generation
+        self._node_generations = {}
+        self._spec_generations = {}
+
+    @property
+    def stats(self):
+        """Returns (hits, misses, evictions).
+        """
+        return (self._cache.hits, self._cache.misses, self._cache.evictions)
+
+    def node_id(self, node):
+        """Returns id of node, watching for node to be freed.
+        """
+        node_id = id(node)
+        if node_id not in self._node_refs:
+            self._node_refs[node_id] = weakref.ref(
+                node, lambda ref: self._forget_id(node_id))
+        return node_id
+
+    def generation(self, node, spec):
+        """Returns the current generation of results of node for spec.
+        """
+        node_id = self.node_id(node)
+        return (self._node_generations.get(node_id, 0),
+                self._spec_generations.get((node_id, spec), 0))
+
+    def make_key(self, node, spec, params, generation=None):
+        """Returns a key for the request, or None if params are not hashable.
+        """
+        if generation is None:
+            generation = self.generation(node, spec)
+        key = (self.node_id(node), spec, generation, tuple(sorted(params.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, node, spec, params):
+        """Returns (True, result) if cached, or (False, None).
+        """
+        key = self.make_key(node, spec, params)
+        if key is None:
+            self._cache.misses += 1
+            return (False, None)
+        # looked up at once, as the worker thread may evict it meanwhile.
+        result = self._cache.get(key, _MISSING)
+        if result is _MISSING:
+            return (False, None)
+        return (True, result)
+
+    def put(self, node, spec, params, result, generation=None):
+        """Keeps result, unless its generation has been invalidated.
+        """
+        if generation is None:
+            generation = self.generation(node, spec)
+        elif generation != self.generation(node, spec):
+            return
+        key = self.make_key(node, spec, params, generation)
+        if key is not None:
+            self._cache.put(key, result)
+
+    def invalidate(self, node, specs=None):
+        """Drops results of node for specs, or all if specs is None.
+        """
+        node_id = self.node_id(node)
+        if specs is None:
+            self._node_generations[node_id] = self._node_generations.get(node_id, 0) + 1
+        else:
+            for spec in specs:
+                key = (node_id, spec)
+                self._spec_generations[key] = self._spec_generations.get(key, 0) + 1
+        self._discard(node_id, specs)
+
+    def forget(self, node):
+        """Drops results and generations of node, e.g. a node removed.
+        """
+        if id(node) in self._node_refs:
+            self._forget_id(id(node))
+
+    def _forget_id(self, node_id):
+        self._node_refs.pop(node_id, None)
+        self._node_generations.pop(node_id, None)
+        for key in self._spec_generations.keys():
+            if key[0] == node_id:
+                self._spec_generations.pop(key, None)
+        self._discard(node_id)
+
+    def _discard(self, node_id, specs=None):
+        for key in self._cache.keys():
+            if key[0] == node_id and (specs is None or key[1] in specs):
+                self._cache.discard(key)
+
+    def clear(self):
+        self._cache.clear()
+
+
+# shared by all pipeline nodes.
+RESULT_CACHE = ResultCache()
+
+
+class UpdateScheduler(object):
+    """Coalesces updates of pipeline nodes into one per frame interval.
+
+    schedule(key, func) arranges func() to be called on the next flush.
+    A later func for the same key replaces the earlier one, so that only
+    the latest of a burst of updates, e.g. from dragging a slider, is
+    made. Flushes are at least interval seconds apart, which caps
+    updates and renders at the display rate.
+
+    Timing is left to call_later(milliseconds, func), e.g. wx.CallLater,
+    calling func on the GUI thread. If it is None, updates are made
+    immediately.
+
+    >>> calls = []
+    >>> scheduler = UpdateScheduler(call_later=lambda ms, func: calls.append(func))
+    >>> for index in range(10):
+    ...     scheduler.schedule('node', lambda index=index: sys.stdout.write('%d\\n' % index))
+    >>> len(calls) # timer armed once
+    1
+    >>> calls[0]()
+    9
+
+    """
+    def __init__(self, interval=1.0 / 60, call_later=None):
+        """Initializer.
+        """
+        self.interval = interval
+        self.call_later = call_later
+        self._pending = OrderedDict()
+        self._armed = False
+        self._last_flush = 0.0
+
+    def schedule(self, key, func):
+        """Calls func() on the next flush, replacing one scheduled for key.
+        """
+        if self.call_later is None:
+            func()
+            return
+        self._pending.pop(key, None)
+        self._pending[key] = func
+        if not self._armed:
+            self._armed = True
+            wait = self._last_flush + self.interval - time.time()
+            self.call_later(max(int(wait * 1000), 1), self.flush)
+
+    def flush(self):
+        """Makes all updates scheduled, in the order first scheduled.
+        """
+        self._armed = False
+        self._last_flush = time.time()
+        pending, self._pending = self._pending, OrderedDict()
+        for func in pending.values():
+            try:
+                func()
+            except Exception, e:
+                warning('Scheduled update failed: %s' % str(e))
+
+
+# shared by all pipeline nodes.
+UPDATE_SCHEDULER = UpdateScheduler()
+
+
+def set_update_timer(call_later):
+    """Sets how UPDATE_SCHEDULER waits for the next frame.
+
+    call_later(milliseconds, func) should call func later on the GUI
+    thread; wx.CallLater does. None makes updates immediately.
+    """
+    UPDATE_SCHEDULER.call_later = call_later
+
+
 class PipelineEvent(object):
     """Represents an event passed throught pipeline.
     """
@@ -36,14 +580,14 @@ class PipelineEvent(object):
         # event data
         self.data = data
         # visitor note for pipeline nodes.
-        self.visited = []
+        self.visited = set()
 
     def note_visited(self, node):
         """Log a visit note. Returns false if node has already visited.
         """
         if node in self.visited:
             return False
-        self.visited.append(node)
+        self.visited.add(node)
         return True
 
     def get_data_digest(self):
@@ -59,8 +603,32 @@ class PipelineEvent(object):
 
 class UpdateEvent(PipelineEvent):
     """Event indicating any updates.
+
+    changed holds what has changed for the node the event starts from,
+    e.g. names of its parameters, or None for anything. While the event
+    propagates down, affected records output specs each node found
+    affected, or None for all, which tells its children what changed.
     """
-    pass
+    def __init__(self, data, changed=None):
+        """Initializer.
+        """
+        PipelineEvent.__init__(self, data)
+        if changed is not None:
+            changed = set(changed)
+        self.changed = changed
+        self.affected = {}
+
+    def get_changed_inputs(self, node):
+        """Returns what has changed for node, or None for anything.
+        """
+        if node.parent is None or node.parent not in self.affected:
+            return self.changed
+        affected = self.affected[node.parent]
+        if affected is None:
+            return None
+        if node.input_spec:
+            return affected & set(node.input_spec)
+        return set(affected)
 
 
 class PipelineSpecMetaClass(type):
@@ -204,6 +772,10 @@ class PipelineNode(object):
     CLASS_NAME = None # subclass may override this
     INPUT_SPEC = []
     OUTPUT_SPEC = []
+    # output spec -> names of parameters and input specs it depends on.
+    # output specs not listed depend on anything. specs not in output spec
+    # may be listed for intermediate results kept in RESULT_CACHE.
+    SPEC_DEPENDENCIES = {}
     
     def __init__(self, name=None):
         """Initializer.
@@ -216,6 +788,8 @@ class PipelineNode(object):
         self.upward_event_handlers = {}
         self.downward_event_handlers = {}
         self.observers = []
+        # names passed to schedule_notify_changed() not notified yet
+        self._pending_changes = set()
 
     def __repr__(self):
         """Retrurns in <class_name: instance_name> format.
@@ -225,7 +799,7 @@ class PipelineNode(object):
     def finalize(self):
         """Finalizer.
         """
-        pass
+        RESULT_CACHE.forget(self)
 
     @property
     def class_name(self):
@@ -310,6 +884,8 @@ class PipelineNode(object):
         """Un-bind child from a member of children.
         """
         if child in self.children:
+            # results depend on the parent.
+            RESULT_CACHE.invalidate(child)
             # **implicitly** unbind child's parent
             child.parent = None
             self.children.remove(child)
@@ -343,6 +919,103 @@ class PipelineNode(object):
         """
         return None
 
+    def request_data_cached(self, spec, **params):
+        """Memoized request_data(), kept in RESULT_CACHE.
+
+        Results are reused until an UpdateEvent passes this node. None is
+        not cached, as it usually means data are not available yet. A
+        result invalidated while it was computed, or computed with
+        parameters changed since the request was made, is returned, not
+        cached.
+
+        >>> class CountingNode(PipelineNode):
+        ...     count = 0
+        ...     def request_data(self, spec, **params):
+        ...         self.count += 1
+        ...         return self.count
+        >>> node = CountingNode()
+        >>> node.request_data_cached(UriSpec), node.request_data_cached(UriSpec)
+        (1, 1)
+        >>> node.propagate_down(UpdateEvent(None))
+        >>> node.request_data_cached(UriSpec)
+        2
+
+        """
+        found, result = RESULT_CACHE.get(self, spec, params)
+        if not found:
+            generation = RESULT_CACHE.generation(self, spec)
+            result = self.request_data(spec, **params)
+            if result is not None and not parameters_outdated():
+                RESULT_CACHE.put(self, spec, params, result, generation)
+        return result
+
+    def get_cached_data(self, spec, **params):
+        """Returns the result of request_data_cached() if it is cached,
+        or None, without requesting data.
+
+        The GUI thread uses this to show data loaded on the worker thread
+        without waiting for a load in progress.
+
+        >>> node = PipelineNode()
+        >>> node.get_cached_data(UriSpec) # None
+
+        """
+        found, result = RESULT_CACHE.get(self, spec, params)
+        return result
+
+    # parameter interfaces
+
+    def get_parameter_names(self):
+        """Returns names of parameters the output specs depend on.
+        """
+        names = set()
+        for dependencies in self.SPEC_DEPENDENCIES.values():
+            names.update(name for name in dependencies
+                         if isinstance(name, basestring))
+        return names
+
+    def snapshot_parameters(self):
+        """Returns copies of parameters of this node and its ancestors,
+        as {node: {name: value}}.
+        """
+        return dict(
+            (node, dict((name, copy.copy(getattr(node, name)))
+                        for name in node.get_parameter_names()))
+            for node in self.ancestors)
+
+    def get_parameter(self, name):
+        """Returns parameter name of this node, as snapshot for the
+        request served by this thread if any.
+
+        Nodes read parameters named in SPEC_DEPENDENCIES by this while
+        serving requests, so that a request on the worker thread sees
+        them as they were when it was made.
+
+        >>> class ScalingNode(PipelineNode):
+        ...     OUTPUT_SPEC = [UriSpec]
+        ...     SPEC_DEPENDENCIES = {UriSpec: ['scale']}
+        ...     scale = 1
+        ...     def request_data(self, spec, **params):
+        ...         return self.get_parameter('scale')
+        >>> node = ScalingNode()
+        >>> future = node.run_async(node.request_data, UriSpec)
+        >>> node.scale = 2
+        >>> future.result(), node.request_data(UriSpec)
+        (1, 2)
+
+        """
+        snapshot = getattr(_request_parameters, 'snapshot', None)
+        if snapshot is not None and self in snapshot:
+            return snapshot[self][name]
+        return getattr(self, name)
+
+    def run_async(self, func, *args, **kwargs):
+        """Calls func(*args, **kwargs) on the worker thread as run_async()
+        does, with parameters of this node and its ancestors snapshot now.
+        """
+        return run_async(_call_with_parameters, self.snapshot_parameters(),
+                         func, args, kwargs)
+
     # event handling interfaces
 
     def handle_upward_event(self, pipeline_event):
@@ -353,33 +1026,155 @@ class PipelineNode(object):
     def handle_downward_event(self, pipeline_event):
         """Handles downstreaming pipeline event. Subclass may override.
         """
-        # default behaviour will respond to UpdateEvent.
+        # default behaviour will respond to UpdateEvent. cached results
+        # affected are already dropped by propagate_down().
         if isinstance(pipeline_event, UpdateEvent):
-            self.status_changed()
+            self.internal_update()
+            self.update_observers()
+
+    def invalidate_results(self, specs=None):
+        """Drops results of this node for specs kept in RESULT_CACHE.
+        """
+        RESULT_CACHE.invalidate(self, specs)
+
+    def get_affected_specs(self, changed):
+        """Returns output specs affected by changed, or None for all.
+
+        changed is a set of parameter names and input specs, or None.
+
+        >>> class ScalingNode(PipelineNode):
+        ...     OUTPUT_SPEC = [UriSpec, DatasourceSpec]
+        ...     SPEC_DEPENDENCIES = {UriSpec: ['scale', DatasourceSpec]}
+        >>> node = ScalingNode()
+        >>> sorted(spec.__name__ for spec in node.get_affected_specs(set(['scale'])))
+        ['DatasourceSpec', 'UriSpec']
+        >>> node.get_affected_specs(set())
+        set([])
+        >>> node.get_affected_specs(None) # None
+        >>> node.SPEC_DEPENDENCIES = {DatasourceSpec: ['scale'], PipelineSpec: ['scale']}
+        >>> sorted(spec.__name__ for spec in node.get_affected_specs(set(['scale'])))
+        ['DatasourceSpec', 'PipelineSpec', 'UriSpec']
+
+        """
+        if changed is None:
+            return None
+        affected = set()
+        for spec in self.SPEC_DEPENDENCIES.keys():
+            if spec not in self.output_spec and changed.intersection(
+                self.SPEC_DEPENDENCIES[spec]):
+                affected.add(spec)
+        for spec in self.output_spec:
+            dependencies = self.SPEC_DEPENDENCIES.get(spec, None)
+            if dependencies is None:
+                if changed:
+                    affected.add(spec)
+            elif changed.intersection(dependencies):
+                affected.add(spec)
+        return affected
+
+    def notify_changed(self, *names):
+        """Notifies that parameters names of this node have changed.
+
+        Only cached results and descendants depending on them are updated.
+        This node is not updated either if none of its outputs depend on
+        names, unless it has no outputs.
+
+        >>> class SourceNode(PipelineNode):
+        ...     OUTPUT_SPEC = [UriSpec]
+        ...     SPEC_DEPENDENCIES = {UriSpec: ['uri']}
+        ...     def internal_update(self):
+        ...         print 'source updated'
+        >>> class SinkNode(PipelineNode):
+        ...     INPUT_SPEC = [UriSpec]
+        ...     def internal_update(self):
+        ...         print 'updated'
+        >>> source, sink = SourceNode(), SinkNode()
+        >>> sink.connect(source)
+        >>> source.notify_changed('color')
+        >>> source.notify_changed('uri')
+        source updated
+        updated
+        >>> sink.notify_changed('color')
+        updated
+
+        """
+        self.propagate_down(UpdateEvent(None, changed=names))
 
     def propagate_up(self, pipeline_event):
         """Propagates event upward.
+
+        Stops at the first ancestor already visited, as those above it
+        have been visited as well.
+
+        >>> grandparent, parent = PipelineNode('grandparent'), PipelineNode('parent')
+        >>> child1, child2 = PipelineNode('child1'), PipelineNode('child2')
+        >>> parent.connect(grandparent)
+        >>> child1.connect(parent)
+        >>> child2.connect(parent)
+        >>> def note(node, event):
+        ...     print node.name
+        >>> for node in (grandparent, parent, child1, child2):
+        ...     node.upward_event_handlers[PipelineEvent] = [note]
+        >>> event = PipelineEvent(None)
+        >>> child1.propagate_up(event)
+        child1
+        parent
+        grandparent
+        >>> child2.propagate_up(event)
+        child2
+
         """
-        if pipeline_event.note_visited(self):
-            self.handle_upward_event(pipeline_event)
+        node = self
+        while node is not None and pipeline_event.note_visited(node):
+            node.handle_upward_event(pipeline_event)
             # call for extra event handlers
-            event_handlers = self.upward_event_handlers.get(pipeline_event.__class__, [])
+            event_handlers = node.upward_event_handlers.get(pipeline_event.__class__, [])
             for event_handler in event_handlers:
-                event_handler(self, pipeline_event)
-        if self.parent:
-            self.parent.propagate_up(pipeline_event)
+                event_handler(node, pipeline_event)
+            node = node.parent
 
     def propagate_down(self, pipeline_event):
         """Propagates event downward.
+
+        Descendants are visited once each, parents before children, in
+        depth-first order.
         """
-        if pipeline_event.note_visited(self):
-            self.handle_downward_event(pipeline_event)
-            # call for extra event handlers
-            event_handlers = self.downward_event_handlers.get(pipeline_event.__class__, [])
-            for event_handler in event_handlers:
-                event_handler(self, pipeline_event)
-            for child in self.children:
-                child.propagate_down(pipeline_event)
+        # an explicit stack, as deep pipelines may exceed recursion limit.
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not pipeline_event.note_visited(node):
+                continue
+            if node.visit_down(pipeline_event):
+                stack.extend(reversed(node.children))
+
+    def visit_down(self, pipeline_event):
+        """Handles an event propagating down. Returns false to stop it here.
+        """
+        if isinstance(pipeline_event, UpdateEvent):
+            changed = pipeline_event.get_changed_inputs(self)
+            if changed is not None and len(changed) == 0:
+                # nothing this node depends on has changed.
+                return False
+            affected = self.get_affected_specs(changed)
+            pipeline_event.affected[self] = affected
+            if (affected is not None and len(affected) == 0 and self.output_spec
+                and (self.parent is None or self.parent not in pipeline_event.affected)):
+                # none of the outputs of the node the event starts from
+                # depend on what has changed.
+                return False
+            self.invalidate_results(affected)
+            if (changed is None and self.parent is not None
+                and self.parent not in pipeline_event.affected):
+                # an update sent to children after internal_update()
+                # of the parent outdates the parent as well.
+                self.parent.invalidate_results()
+        self.handle_downward_event(pipeline_event)
+        # call for extra event handlers
+        event_handlers = self.downward_event_handlers.get(pipeline_event.__class__, [])
+        for event_handler in event_handlers:
+            event_handler(self, pipeline_event)
+        return True
 
     # observer interfaces
 
@@ -402,9 +1197,31 @@ class PipelineNode(object):
     def status_changed(self, exclude_observers=()):
         """Notifies status change (to observers).
         """
+        self.invalidate_results()
         self.internal_update()
         self.update_observers(exclude_observers)
 
+    def schedule_status_changed(self, exclude_observers=()):
+        """Deferred status_changed(), coalesced by UPDATE_SCHEDULER.
+
+        Repeated calls before the next frame result in one update, which
+        sees the latest status.
+        """
+        UPDATE_SCHEDULER.schedule(
+            (self, 'status_changed'),
+            lambda: self.status_changed(exclude_observers))
+
+    def schedule_notify_changed(self, *names):
+        """Deferred notify_changed(), coalesced by UPDATE_SCHEDULER.
+
+        Names of repeated calls before the next frame are notified at once.
+        """
+        self._pending_changes.update(names)
+        def notify():
+            names, self._pending_changes = self._pending_changes, set()
+            self.notify_changed(*names)
+        UPDATE_SCHEDULER.schedule((self, 'notify_changed'), notify)
+
     def update_observers(self, exclude_observers=()):
         for observer in self.observers:
             if observer not in exclude_observers:
@@ -634,6 +1451,55 @@ def print_pipeline(pipeline, prefix='', indent='  '):
     print_pipeline_item_tree(pipeline.root, indent, indent)
 
 
+def benchmark(fan_outs=(10, 100, 1000), repeat=10):
+    """Times event propagation through per-species filter fan-outs.
+
+    Each pipeline has a loader under the root with fan_out filters, each
+    followed by a visualizer. Propagation is timed with the visited set
+    and with the visited list it replaced.
+    """
+    class ListVisitedEvent(PipelineEvent):
+        def __init__(self, data):
+            PipelineEvent.__init__(self, data)
+            self.visited = []
+        def note_visited(self, node):
+            if node in self.visited:
+                return False
+            self.visited.append(node)
+            return True
+
+    for fan_out in fan_outs:
+        tree = PipelineTree()
+        loader = PipelineNode('loader')
+        loader.connect(tree.root)
+        leaves = []
+        for i in range(fan_out):
+            species_filter = PipelineNode('filter%d' % i)
+            species_filter.connect(loader)
+            visualizer = PipelineNode('visualizer%d' % i)
+            visualizer.connect(species_filter)
+            leaves.append(visualizer)
+        n_nodes = len(tree.root.descendants)
+        for event_class in (ListVisitedEvent, PipelineEvent):
+            start = time.time()
+            for i in range(repeat):
+                tree.propagate(event_class(None))
+                event = event_class(None)
+                for leaf in leaves:
+                    leaf.propagate_up(event)
+            elapsed = (time.time() - start) / repeat
+            print '%d nodes, %s: %.3g ms per propagation down and up' % (
+                n_nodes, event_class.__name__, elapsed * 1e3)
+
+
 if __name__=='__main__':
-    from doctest import testmod, ELLIPSIS
-    testmod(optionflags=ELLIPSIS)
+    from argparse import ArgumentParser
+    args_parser = ArgumentParser(description='Runs doctests of this module.')
+    args_parser.add_argument(
+        '--benchmark', action='store_true',
+        help='times event propagation through large pipelines instead')
+    if args_parser.parse_args().benchmark:
+        benchmark()
+    else:
+        from doctest import testmod, ELLIPSIS
+        testmod(optionflags=ELLIPSIS)
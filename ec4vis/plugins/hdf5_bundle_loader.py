@@ -17,6 +17,8 @@ from ec4vis.inspector.page import InspectorPage, register_inspector_page
 from ec4vis.logger import debug, log_call, warning
 from ec4vis.pipeline import PipelineNode, UpdateEvent, UriSpec, register_pipeline_node
 from ec4vis.pipeline.specs import Hdf5DataSpec, NumberOfItemsSpec
+from ec4vis.utils.cache import LRUCache
+from ec4vis.utils.prefetch import Prefetcher
 
 
 class FileBundle(object):
@@ -71,30 +73,108 @@ class Hdf5BundleLoaderNode(PipelineNode):
     """
     INPUT_SPEC = [UriSpec]
     OUTPUT_SPEC = [Hdf5DataSpec, NumberOfItemsSpec]
+    SPEC_DEPENDENCIES = {
+        Hdf5DataSpec: ['glob_pattern', UriSpec],
+        NumberOfItemsSpec: ['glob_pattern', UriSpec]}
     DEFAULT_GLOB_PATTERN = '*.hdf5'
+    # bounds of open file handles, in number and total file size
+    DEFAULT_MAX_HANDLES = 16
+    DEFAULT_MAX_MEGABYTES = 1024
+    # files ahead of the current one opened in background
+    PREFETCH_DEPTH = 4
 
     def __init__(self, *args, **kwargs):
         """Initializer.
         """
         self._bundle = None
-        self._cache = None
         self.glob_pattern = self.DEFAULT_GLOB_PATTERN
+        # index -> open h5py File. a handle evicted or cleared is not
+        # closed here, for it may still be used downstream (e.g. the frame
+        # shown, or a result in RESULT_CACHE); h5py closes it when the
+        # last reference to it goes.
+        self.cache = LRUCache(
+            max_items=self.DEFAULT_MAX_HANDLES,
+            max_bytes=self.DEFAULT_MAX_MEGABYTES * 1024 * 1024,
+            sizeof=self.sizeof_handle)
+        self.prefetcher = Prefetcher(
+            self.prefetch_handle, depth=self.PREFETCH_DEPTH, cache=self.cache)
         PipelineNode.__init__(self, *args, **kwargs)
 
+    def finalize(self):
+        """Finalizer.
+        """
+        self.prefetcher.close()
+        self.cache.clear()
+        PipelineNode.finalize(self)
+
     def save(self):
-        return dict(glob_pattern=self.glob_pattern)
+        return dict(glob_pattern=self.glob_pattern,
+                    max_handles=self.max_handles,
+                    max_megabytes=self.max_megabytes)
 
     def restore(self, data):
         if isinstance(data, dict):
             self.glob_pattern = data.get(
                 'glob_pattern', self.DEFAULT_GLOB_PATTERN)
+            self.max_handles = data.get(
+                'max_handles', self.DEFAULT_MAX_HANDLES)
+            self.max_megabytes = data.get(
+                'max_megabytes', self.DEFAULT_MAX_MEGABYTES)
+
+    def get_max_handles(self):
+        return self.cache.max_items
+
+    def set_max_handles(self, max_handles):
+        self.cache.max_items = max_handles
+        self.cache.shrink()
+
+    max_handles = property(get_max_handles, set_max_handles)
+
+    def get_max_megabytes(self):
+        return self.cache.max_bytes // (1024 * 1024)
+
+    def set_max_megabytes(self, max_megabytes):
+        self.cache.max_bytes = max_megabytes * 1024 * 1024
+        self.cache.shrink()
+
+    max_megabytes = property(get_max_megabytes, set_max_megabytes)
+
+    def sizeof_handle(self, data):
+        """Returns the size of the file behind an open handle.
+        """
+        try:
+            return os.path.getsize(data.filename)
+        except OSError:
+            return 0
+
+    def open_handle(self, index):
+        """Opens the file at index of the bundle, or returns None.
+        """
+        path = self.bundle.get_path_at(index)
+        if path is None:
+            return None
+        try:
+            return File(path, mode='r')
+        except IOError:
+            return None
+
+    def prefetch_handle(self, index):
+        """Opens the file at index on the prefetch thread.
+        """
+        bundle = self._bundle
+        if bundle is None:
+            return None
+        path = bundle.get_path_at(index)
+        if path is None:
+            return None
+        return File(path, mode='r')
 
     @log_call
     def internal_update(self):
         """Reset bundle and cached hdf5 data.
         """
         self._bundle = None
-        self._cache = None
+        self.prefetcher.clear()
 
     @property
     def bundle(self):
@@ -102,15 +182,9 @@ class Hdf5BundleLoaderNode(PipelineNode):
             uri = self.parent.request_data(UriSpec)
             parsed = urlparse(uri)
             fullpath = parsed.netloc+parsed.path
-            self._bundle = FileBundle(fullpath, self.glob_pattern)
+            self._bundle = FileBundle(fullpath, self.get_parameter('glob_pattern'))
         return self._bundle
 
-    @property
-    def cache(self):
-        if self._cache is None:
-            self._cache = {}
-        return self._cache
-
     @log_call
     def request_data(self, spec, **kwargs):
         """Provides particle data.
@@ -119,16 +193,14 @@ class Hdf5BundleLoaderNode(PipelineNode):
             return self.bundle.n_files
         elif spec==Hdf5DataSpec:
             index = kwargs.get('index', 0)
-            data = self.cache.get(index, None)
-            if data is None:
-                path = self.bundle.get_path_at(index)
-                if not(path is None):
-                    try:
-                        data = File(path, mode='r')
-                        self.cache[index] = data
-                    except IOError:
-                        pass
-            return data
+            n_files = self.bundle.n_files
+            if index < 0:
+                # negative index counts from the end.
+                index += n_files
+            # files next to index are opened in background meanwhile.
+            # a file larger than max_megabytes is returned uncached.
+            self.prefetcher.n_items = n_files
+            return self.prefetcher.get(index, self.open_handle)
         return None
 
 
@@ -145,21 +217,59 @@ class Hdf5BundleLoaderInspector(InspectorPage):
         glob_pattern_label = wx.StaticText(self, -1, 'Glob pattern')
         glob_pattern = wx.TextCtrl(self, -1, "%s" %self.target.glob_pattern)
         self.Bind(wx.EVT_TEXT, self.OnGlobPatternText, glob_pattern)
+        max_handles_label = wx.StaticText(self, -1, 'Max open files')
+        max_handles = wx.SpinCtrl(
+            self, -1, min=1, max=4096, initial=self.target.max_handles)
+        self.Bind(wx.EVT_SPINCTRL, self.OnMaxHandlesSpin, max_handles)
+        max_megabytes_label = wx.StaticText(self, -1, 'Max open size (MB)')
+        max_megabytes = wx.SpinCtrl(
+            self, -1, min=1, max=1024 * 1024, initial=self.target.max_megabytes)
+        self.Bind(wx.EVT_SPINCTRL, self.OnMaxMegabytesSpin, max_megabytes)
+        stats_label = wx.StaticText(self, -1, 'Cache statistics')
+        stats = wx.TextCtrl(self, -1, "", style=wx.TE_READONLY)
         self.sizer.Add(glob_pattern_label, 0, wx.ALL|wx.EXPAND, 5)
         self.sizer.Add(glob_pattern, 0, wx.ALL|wx.EXPAND, 5)
+        self.sizer.Add(max_handles_label, 0, wx.ALL|wx.EXPAND, 5)
+        self.sizer.Add(max_handles, 0, wx.ALL|wx.EXPAND, 5)
+        self.sizer.Add(max_megabytes_label, 0, wx.ALL|wx.EXPAND, 5)
+        self.sizer.Add(max_megabytes, 0, wx.ALL|wx.EXPAND, 5)
+        self.sizer.Add(stats_label, 0, wx.ALL|wx.EXPAND, 5)
+        self.sizer.Add(stats, 0, wx.ALL|wx.EXPAND, 5)
         self.glob_pattern = glob_pattern
+        self.max_handles = max_handles
+        self.max_megabytes = max_megabytes
+        self.stats = stats
+        self.update_stats()
 
     @log_call
     def OnGlobPatternText(self, event):
         pattern = self.glob_pattern.GetValue()
         if pattern:
             self.target.glob_pattern = pattern
-            self.target.internal_update()
-            for child in self.target.children:
-                child.propagate_down(UpdateEvent(None))
+            self.target.notify_changed('glob_pattern')
             
+    @log_call
+    def OnMaxHandlesSpin(self, event):
+        self.target.max_handles = self.max_handles.GetValue()
+        self.update_stats()
+
+    @log_call
+    def OnMaxMegabytesSpin(self, event):
+        self.target.max_megabytes = self.max_megabytes.GetValue()
+        self.update_stats()
+
+    def update_stats(self):
+        cache = self.target.cache
+        self.stats.SetValue(
+            "%d open (%.1f MB), %d hits, %d misses, %d evictions"
+            %(len(cache), cache.nbytes / (1024.0 * 1024.0),
+              cache.hits, cache.misses, cache.evictions))
+
     def update(self):
         self.glob_pattern.SetValue("%s" %self.target.glob_pattern)
+        self.max_handles.SetValue(self.target.max_handles)
+        self.max_megabytes.SetValue(self.target.max_megabytes)
+        self.update_stats()
 
 
 register_inspector_page('Hdf5BundleLoaderNode', Hdf5BundleLoaderInspector)
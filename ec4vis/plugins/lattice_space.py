@@ -9,9 +9,11 @@ except ImportError:
     import sys, os
     p = os.path.abspath(__file__); sys.path.insert(0, p[: p.rindex(os.sep + 'ec4vis')])
 
-from ec4vis.plugins.spatiocyte_tools import coord2point
+from ec4vis.plugins.spatiocyte_tools import coord2point_array
 from ec4vis.plugins.particle_space import Particle
 
+COORD_DTYPE = numpy.uint32
+
 class LatticeParticle(object):
 
     def __init__(self, sid, coord):
@@ -25,24 +27,57 @@ class OffLatticeParticle(object):
         self.point = point
 
 class LatticeParticleSpace(object):
+    """Particles of a Spatiocyte frame, kept as arrays per species.
+
+    Lattice species hold an array of voxel coordinates and off-lattice
+    species an (n, 3) array of normalized points. Positions are computed
+    from them on demand and cached.
+
+    >>> ps = LatticeParticleSpace(0, 1, 5, 3, 4, 0.5,
+    ...                           [('A', 0.5), ('B', 0.5)], [('C', 0.25)])
+    >>> ps.add_coords(0, [0, 1])
+    >>> ps.add_coords(0, [13])
+    >>> ps.add_points(0, [[1.0, 2.0, 3.0]])
+    >>> ps.species
+    ['A', 'C']
+    >>> map(int, ps.get_coords('A'))
+    [0, 1, 13]
+    >>> (ps.get_positions('A') == coord2point_array([0, 1, 13], 3, 4)).all()
+    True
+    >>> ps.get_positions('C').tolist()
+    [[1.0, 2.0, 3.0]]
+    >>> ps.get_positions().shape, ps.get_radii().tolist()
+    ((4, 3), [0.5, 0.5, 0.5, 0.25])
+    >>> ps.num_particles(), ps.num_particles('B'), ps.get_positions('B').shape
+    (4, 0, (0, 3))
+    >>> ps.get_pids('A').tolist(), ps.get_pids('C').tolist(), ps.get_pids().tolist()
+    ([0, 1, 2], [3], [0, 1, 2, 3])
+    >>> ps.pid_offset = 10
+    >>> ps.get_pids('C').tolist(), [pid for pid, p in ps.list_particles()]
+    ([13], [10, 11, 12, 13])
+    """
 
     def __init__(self, index, max_index, col_size, row_size, layer_size, voxel_radius,
             lattice_species, offlattice_species):
         self.__index = index
         self.__max_index = max_index
         self.__time = 0
+        # sid -> list of coordinate arrays, concatenated on demand
         self.__lattice_pool = {}
+        # sid -> list of point arrays, concatenated on demand
         self.__offlattice_pool = {}
+        self.__positions_cache = {}
         self.__row_size = row_size
         self.__layer_size = layer_size
         self.__voxel_radius = voxel_radius
-        #self.__species = []
-        #self.__species.extend(lattice_species)
-        #self.__species.extend(offlattice_species)
         self.__lattice_species = lattice_species
         self.__offlattice_species = offlattice_species
+        self.__lattice_keys = self.__species_keys(lattice_species)
+        self.__offlattice_keys = self.__species_keys(offlattice_species)
 
         self.static_bounds = None
+        # the first pid, set by offset_pids() when spaces are merged
+        self.pid_offset = 0
 
     def getIndex(self):
         return self.__index
@@ -60,109 +95,208 @@ class LatticeParticleSpace(object):
     def voxel_radius(self):
         return self.__voxel_radius
 
+    @property
+    def nbytes(self):
+        """Bytes held by coordinates, points and cached positions.
+        """
+        arrays = self.__positions_cache.values()
+        for chunks in self.__lattice_pool.values() + self.__offlattice_pool.values():
+            arrays.extend(chunks)
+        return sum(array.nbytes for array in arrays)
+
     @property
     def species(self):
         species = []
-        if self.__lattice_pool is not None:
-            for sid in self.__lattice_pool.keys():
+        for sid in sorted(self.__lattice_pool.keys()):
+            if len(self.__coords(sid)) > 0:
                 (string, radius) = self.__lattice_species[sid]
                 species.append(string)
-        if self.__offlattice_pool is not None:
-            for sid in self.__offlattice_pool.keys():
+        for sid in sorted(self.__offlattice_pool.keys()):
+            if len(self.__points(sid)) > 0:
                 (string, radius) = self.__offlattice_species[sid]
-                species.append(string)
+                if string not in species:
+                    species.append(string)
         return species
 
+    def __species_keys(self, species):
+        keys = {}
+        for key, (string, radius) in enumerate(species):
+            keys.setdefault(string, key)
+        return keys
+
     def add_particle(self, particle):
         if isinstance(particle, LatticeParticle):
-            self.__add_particle_on_lattice(particle)
+            self.add_coords(particle.sid, [particle.coord])
         elif isinstance(particle, OffLatticeParticle):
-            self.__add_particle_off_lattice(particle)
-
-    def __add_particle_on_lattice(self, lattice):
-        sid = lattice.sid
-        if sid not in self.__lattice_pool.keys():
-            self.__lattice_pool[sid] = []
-        self.__lattice_pool[sid].append(lattice)
-
-    def __add_particle_off_lattice(self, offlattice):
-        sid = offlattice.sid
-        if sid not in self.__offlattice_pool.keys():
-            self.__offlattice_pool[sid] = []
-        self.__offlattice_pool[sid].append(offlattice)
-
-    def __lattice2particle(self, lattice):
-        pos = coord2point(lattice.coord, self.__row_size, self.__layer_size)
-        pos = numpy.array(pos) * 2 * self.__voxel_radius
-        (string, radius) = self.__lattice_species[lattice.sid]
-        return Particle(string, pos, radius)
-
-    def __offlattice2particle(self, offlattice):
-        #pos = list(offlattice.point)
-        pos = offlattice.point
-        pos = numpy.array(pos) * 2 * self.__voxel_radius
-        (string, radius) = self.__offlattice_species[offlattice.sid]
-        return Particle(string, pos, radius)
-
-    def __translate2particles(self, particles):
-        result = []
-        pid = 0
-        for p in particles:
-            if isinstance(p, LatticeParticle):
-                result.append((pid,self.__lattice2particle(p)))
-            elif isinstance(p, OffLatticeParticle):
-                result.append((pid,self.__offlattice2particle(p)))
-        return result
+            self.add_points(particle.sid, [particle.point])
+
+    def add_coords(self, sid, coords):
+        """Adds voxel coordinates of lattice species sid at once.
+        """
+        coords = numpy.asarray(coords, dtype=COORD_DTYPE)
+        self.__lattice_pool.setdefault(sid, []).append(coords)
+        self.__positions_cache.clear()
+
+    def add_points(self, sid, points):
+        """Adds (n, 3) normalized points of off-lattice species sid at once.
+        """
+        points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3))
+        self.__offlattice_pool.setdefault(sid, []).append(points)
+        self.__positions_cache.clear()
+
+    def __coords(self, sid):
+        chunks = self.__lattice_pool.get(sid, [])
+        if len(chunks) == 0:
+            return numpy.empty(0, dtype=COORD_DTYPE)
+        elif len(chunks) > 1:
+            chunks[:] = [numpy.concatenate(chunks)]
+        return chunks[0]
+
+    def __points(self, sid):
+        chunks = self.__offlattice_pool.get(sid, [])
+        if len(chunks) == 0:
+            return numpy.empty((0, 3), dtype=numpy.float64)
+        elif len(chunks) > 1:
+            chunks[:] = [numpy.concatenate(chunks)]
+        return chunks[0]
+
+    def __lattice_positions(self, sid):
+        pos = coord2point_array(
+            self.__coords(sid), self.__row_size, self.__layer_size)
+        return pos * 2 * self.__voxel_radius
+
+    def __offlattice_positions(self, sid):
+        return self.__points(sid) * 2 * self.__voxel_radius
 
     def __string2key_of_lattice(self, string):
-        for key in range(len(self.__lattice_species)):
-            #for key in self.__lattice_pool.keys():
-            (s, r) = self.__lattice_species[key]
-            if (string is s):
-                return key
-        return None
+        return self.__lattice_keys.get(string, None)
 
     def __string2key_of_offlattice(self, string):
-        for key in range(len(self.__offlattice_species)):
-            #for key in self.__offlattice_pool.keys():
-            (s, r) = self.__offlattice_species[key]
-            if (string is s):
-                return key
-        return None
+        return self.__offlattice_keys.get(string, None)
+
+    def get_coords(self, sid):
+        """Returns voxel coordinates of lattice species sid (a name).
+        """
+        key = self.__string2key_of_lattice(sid)
+        if key is None:
+            return numpy.empty(0, dtype=COORD_DTYPE)
+        return self.__coords(key)
+
+    def get_points(self, sid):
+        """Returns normalized points of off-lattice species sid (a name).
+        """
+        key = self.__string2key_of_offlattice(sid)
+        if key is None:
+            return numpy.empty((0, 3), dtype=numpy.float64)
+        return self.__points(key)
+
+    def get_positions(self, sid=None):
+        """Returns an (n, 3) array of positions of species sid, or of all.
+        """
+        if sid is None:
+            arrays = [self.get_positions(s) for s in self.species]
+        else:
+            positions = self.__positions_cache.get(sid, None)
+            if positions is not None:
+                return positions
+            arrays = []
+            key = self.__string2key_of_lattice(sid)
+            if key is not None:
+                arrays.append(self.__lattice_positions(key))
+            key = self.__string2key_of_offlattice(sid)
+            if key is not None:
+                arrays.append(self.__offlattice_positions(key))
+        if len(arrays) == 0:
+            positions = numpy.empty((0, 3), dtype=numpy.float64)
+        elif len(arrays) == 1:
+            positions = arrays[0]
+        else:
+            positions = numpy.concatenate(arrays)
+        if sid is not None:
+            self.__positions_cache[sid] = positions
+        return positions
+
+    def get_radii(self, sid=None):
+        """Returns an array of radii of species sid, or of all.
+        """
+        if sid is None:
+            arrays = [self.get_radii(s) for s in self.species]
+            if len(arrays) == 0:
+                return numpy.empty(0, dtype=numpy.float64)
+            return numpy.concatenate(arrays)
+        arrays = []
+        key = self.__string2key_of_lattice(sid)
+        if key is not None:
+            (string, radius) = self.__lattice_species[key]
+            arrays.append(numpy.repeat(radius, len(self.__coords(key))))
+        key = self.__string2key_of_offlattice(sid)
+        if key is not None:
+            (string, radius) = self.__offlattice_species[key]
+            arrays.append(numpy.repeat(radius, len(self.__points(key))))
+        if len(arrays) == 0:
+            return numpy.empty(0, dtype=numpy.float64)
+        return numpy.concatenate(arrays).astype(numpy.float64)
+
+    def get_pids(self, sid=None):
+        """Returns serial pids of species sid, or of all.
+
+        Pids are numbered from pid_offset through species in order, so
+        that they are unique within the space.
+        """
+        start = self.pid_offset
+        if sid is not None:
+            for s in self.species:
+                if s == sid:
+                    break
+                start += self.num_particles(s)
+        return numpy.arange(
+            start, start + self.num_particles(sid), dtype=numpy.int64)
+
+    def get_Ds(self, sid=None):
+        return numpy.zeros(self.num_particles(sid), dtype=numpy.float64)
 
     def list_particles(self, sid=None):
-        retval = []
-        retval.extend(self.list_lattice(sid))
-        retval.extend(self.list_offlattice(sid))
-
-        for particle in retval:
-            p = particle[1]
-
-        return retval
+        """Returns a list of (pid, Particle), built from the arrays.
+        """
+        if sid is None:
+            retval = []
+            for s in self.species:
+                retval.extend(self.list_particles(s))
+            return retval
+        positions = self.get_positions(sid)
+        radii = self.get_radii(sid)
+        return [(int(pid), Particle(sid, pos, radius))
+                for pid, pos, radius in zip(self.get_pids(sid), positions, radii)]
 
     def list_lattice(self, sid=None):
         if sid is None:
             retval = []
-            for lattices in self.__lattice_pool.values():
-                retval.extend(self.__translate2particles(lattices))
+            for key in sorted(self.__lattice_pool.keys()):
+                (string, radius) = self.__lattice_species[key]
+                retval.extend(self.list_lattice(string))
             return retval
-        else:
-            sid = self.__string2key_of_lattice(sid)
-            if sid is None:
-                return []
-            return self.__translate2particles(self.__lattice_pool[sid])
+        key = self.__string2key_of_lattice(sid)
+        if key is None:
+            return []
+        positions = self.__lattice_positions(key)
+        (string, radius) = self.__lattice_species[key]
+        return [(pid, Particle(string, pos, radius))
+                for pid, pos in enumerate(positions)]
 
     def list_offlattice(self, sid=None):
         if sid is None:
             retval = []
-            for offlattices in self.__offlattice_pool.values():
-                retval.extend(self.__translate2particles(offlattices))
+            for key in sorted(self.__offlattice_pool.keys()):
+                (string, radius) = self.__offlattice_species[key]
+                retval.extend(self.list_offlattice(string))
             return retval
-        else:
-            sid = self.__string2key_of_offlattice(sid)
-            if sid is None:
-                return []
-            return self.__translate2particles(self.__offlattice_pool[sid])
+        key = self.__string2key_of_offlattice(sid)
+        if key is None:
+            return []
+        positions = self.__offlattice_positions(key)
+        (string, radius) = self.__offlattice_species[key]
+        return [(pid, Particle(string, pos, radius))
+                for pid, pos in enumerate(positions)]
 
     def num_particles(self, sid=None):
         num = 0
@@ -172,22 +306,48 @@ class LatticeParticleSpace(object):
 
     def num_lattices(self, sid=None):
         if sid is None:
-            counts = [len(lattices) for lattices in self.__lattice_pool.values()]
+            counts = [len(self.__coords(key)) for key in self.__lattice_pool.keys()]
             return sum(counts)
         else:
-            sid = self.__string2key_of_lattice(sid)
-            if sid is None:
+            key = self.__string2key_of_lattice(sid)
+            if key is None:
                 return 0
-            return len(self.__lattice_pool[sid])
+            return len(self.__coords(key))
 
     def num_offlattices(self, sid=None):
         if sid is None:
-            counts = [len(offlattices) for offlattices in self.__offlattice_pool.values()]
+            counts = [len(self.__points(key)) for key in self.__offlattice_pool.keys()]
             return sum(counts)
         else:
-            sid = self.__string2key_of_offlattice(sid)
-            if sid is None:
+            key = self.__string2key_of_offlattice(sid)
+            if key is None:
                 return 0
-            return len(self.__offlattice_pool[sid])
+            return len(self.__points(key))
 
 # end of LatticeParticleSpace
+
+
+def offset_pids(spaces):
+    """Numbers pids of lattice particle spaces in a row, so that they stay
+    unique when the spaces are merged. None in spaces is skipped.
+
+    >>> spaces = [LatticeParticleSpace(0, 1, 5, 3, 4, 0.5, [('A', 0.5)], [])
+    ...           for i in range(2)]
+    >>> spaces[0].add_coords(0, [0, 1])
+    >>> spaces[1].add_coords(0, [2])
+    >>> offset_pids([spaces[0], None, spaces[1]])
+    >>> spaces[1].get_pids('A').tolist()
+    [2]
+
+    """
+    offset = 0
+    for space in spaces:
+        if space is None:
+            continue
+        space.pid_offset = offset
+        offset += space.num_particles()
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
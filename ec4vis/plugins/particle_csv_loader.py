@@ -5,7 +5,14 @@ import os.path
 import csv
 import re
 import glob
+from itertools import islice
 from urlparse import urlparse
+import numpy
+try:
+    import pandas
+except ImportError:
+    # CSV files are parsed by the csv module instead.
+    pandas = None
 import wx, wx.aui
 
 # this allows module-wise execution
@@ -16,33 +23,152 @@ except ImportError:
     p = os.path.abspath(__file__); sys.path.insert(0, p[: p.rindex(os.sep + 'ec4vis')])
 
 from ec4vis.logger import debug, log_call, warning
-from ec4vis.pipeline import PipelineNode, PipelineSpec, UpdateEvent, UriSpec, register_pipeline_node
+from ec4vis.pipeline import PipelineNode, PipelineSpec, ProgressReporter, UpdateEvent, UriSpec, can_show_dialogs, register_pipeline_node
 from ec4vis.pipeline.specs import NumberOfItemsSpec
-from ec4vis.plugins.particle_space import Particle, ParticleSpace
+from ec4vis.plugins.particle_space import ParticleSpace, merge_particle_spaces
+from ec4vis.utils.pool import map_in_pool
 
 class ParticleSpaceSpec(PipelineSpec):
     pass
 
-def load_particles_from_csv(filename, ps=None):
-    if not os.path.isfile(filename):
-        return ps
+# rows are read in chunks of about this many lines, to bound memory use.
+CSV_CHUNK_SIZE = 100000
+# x, y, z, radius, pid and sid
+CSV_COLUMNS = 6
 
-    if ps is None:
-        ps = ParticleSpace()
+def parse_pids(pids):
+    """Returns pids as an integer array, or None if any is not an integer.
+    """
+    try:
+        return numpy.asarray(pids).astype(numpy.int64)
+    except ValueError:
+        return None
+
+def read_csv_chunks(fin, chunk_size=CSV_CHUNK_SIZE):
+    """Yields lists of about chunk_size lines of fin, made of whole records.
+
+    A chunk is extended while its quotes are unbalanced, so that a quoted
+    field with newlines is not split between chunks.
 
+    >>> from StringIO import StringIO
+    >>> list(read_csv_chunks(StringIO('1,"a\\nb"\\n2,c\\n3,d\\n'), 1))
+    [['1,"a\\n', 'b"\\n'], ['2,c\\n'], ['3,d\\n']]
+
+    """
+    while True:
+        lines = list(islice(fin, chunk_size))
+        if len(lines) == 0:
+            break
+        quotes = ''.join(lines).count('"')
+        while quotes % 2 == 1:
+            line = next(fin, '')
+            if line == '':
+                break
+            lines.append(line)
+            quotes += line.count('"')
+        yield lines
+
+def parse_csv_rows(lines):
+    """Returns x, y, z and radius as an (n, 4) array, pids and sids of
+    CSV lines, skipping blank ones.
+
+    >>> values, pids, sids = parse_csv_rows(['1,2,3,0.5,7,A\\n', '\\n', '4,5,6,0.5,8,"B"\\n'])
+    >>> values.tolist(), pids.tolist(), sids.tolist()
+    ([[1.0, 2.0, 3.0, 0.5], [4.0, 5.0, 6.0, 0.5]], ['7', '8'], ['A', 'B'])
+    >>> parse_csv_rows(['1,2,3,0.5'])
+    Traceback (most recent call last):
+    ...
+    ValueError: Expected 6 columns, got 4: 1,2,3,0.5
+
+    """
+    rows = [row for row in csv.reader(lines) if len(row) > 0]
+    for row in rows:
+        if len(row) < CSV_COLUMNS:
+            raise ValueError('Expected %d columns, got %d: %s'
+                             % (CSV_COLUMNS, len(row), ','.join(row)))
+    # x, y, z and radius
+    values = numpy.fromstring(
+        ','.join(','.join(row[: 4]) for row in rows), sep=',')
+    if len(values) != 4 * len(rows):
+        raise ValueError('Failed to parse numeric columns')
+    return (values.reshape((-1, 4)), numpy.array([row[4] for row in rows]),
+            numpy.array([row[5] for row in rows]))
+
+def read_csv_rows(filename, chunk_size=CSV_CHUNK_SIZE):
+    """Yields (values, pids, sids) as parse_csv_rows() does for chunks
+    of rows of a CSV file, skipping the first line.
+
+    pandas.read_csv() parses each chunk at once if pandas is available,
+    and the csv module does otherwise.
+    """
+    if pandas is not None:
+        tables = pandas.read_csv(
+            filename, header=None, skiprows=1, chunksize=chunk_size,
+            usecols=range(CSV_COLUMNS), dtype={4: str, 5: str},
+            keep_default_na=False, na_values={0: [''], 1: [''], 2: [''], 3: ['']})
+        for table in tables:
+            if table.isnull().values.any():
+                raise ValueError('Expected %d columns' % CSV_COLUMNS)
+            yield (table.iloc[:, : 4].values.astype(numpy.float64),
+                   table.iloc[:, 4].values, table.iloc[:, 5].values)
+        return
     fin = open(filename, 'r')
     try:
         line = fin.readline() # skip the first line
-
-        reader = csv.reader(fin)
-        for row in reader:
-            pos = [float(column) for column in row[: 3]]
-            radius = float(row[3])
-            pid = row[4] # eval(row[4])
-            sid = row[5] # eval(row[5])
-            ps.add_particle(pid, Particle(sid, pos, radius))
+        for lines in read_csv_chunks(fin, chunk_size):
+            yield parse_csv_rows(lines)
     finally:
         fin.close()
+
+def add_csv_rows(ps, lines, first_pid=0):
+    """Parses CSV lines at once and adds the particles to ps by species.
+
+    If pids are not integers, rows are numbered from first_pid instead.
+    Returns the number of rows.
+
+    >>> ps = ParticleSpace()
+    >>> add_csv_rows(ps, ['1,2,3,0.5,a,"B,\\n', '1"\\n', '\\n', '4,5,6,0.5,b,A\\n'], 10)
+    2
+    >>> ps.species, ps.get_pids('B,\\n1').tolist(), ps.get_pids('A').tolist()
+    (['A', 'B,\\n1'], [10], [11])
+
+    """
+    values, pids, sids = parse_csv_rows(lines)
+    return add_particle_rows(ps, values, pids, sids, first_pid)
+
+def add_particle_rows(ps, values, pids, sids, first_pid=0):
+    """Adds particles of rows given as parse_csv_rows() returns to ps by
+    species. Returns the number of rows.
+    """
+    if len(values) == 0:
+        return 0
+    species, inverse = numpy.unique(sids, return_inverse=True)
+    order = numpy.argsort(inverse, kind='mergesort')
+    values = values[order]
+    pids = parse_pids(pids)
+    if pids is None:
+        pids = numpy.arange(first_pid, first_pid + len(values), dtype=numpy.int64)
+    pids = pids[order]
+    stops = numpy.cumsum(numpy.bincount(inverse))
+    start = 0
+    for sid, stop in zip(species, stops):
+        ps.add_particles(
+            str(sid), values[start: stop, : 3], values[start: stop, 3],
+            pids[start: stop])
+        start = stop
+    return len(values)
+
+def load_particles_from_csv(filename, ps=None, chunk_size=CSV_CHUNK_SIZE):
+    if not os.path.isfile(filename):
+        return ps
+
+    if ps is None:
+        ps = ParticleSpace()
+
+    # rows without integer pids are numbered through the file.
+    first_pid = 0
+    for values, pids, sids in read_csv_rows(filename, chunk_size):
+        first_pid += add_particle_rows(ps, values, pids, sids, first_pid)
     return ps
 
 class ParticleCSVLoaderProgressDialog(wx.ProgressDialog):
@@ -51,24 +177,38 @@ class ParticleCSVLoaderProgressDialog(wx.ProgressDialog):
         wx.ProgressDialog.__init__(
             self, "Loading ...",
             "File remaining", len(filenames),
-            style=wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME | wx.PD_AUTO_HIDE)
+            style=wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME | wx.PD_AUTO_HIDE
+            | wx.PD_CAN_ABORT)
 
         self.filenames = filenames
 
-    def Show(self):
-        ps = ParticleSpace()
+def load_particles_from_csv_files(filenames):
+    """Loads the files in worker processes and merges them in order.
+    Returns None if cancelled.
 
-        for i, filename in enumerate(self.filenames):
-            ps = load_particles_from_csv(filename, ps)
-            if not self.Update(i):
-                return None
-        return ps
+    Progress is shown in a dialog on the GUI thread, if dialogs may be
+    shown.
+    """
+    progress = None
+    if can_show_dialogs():
+        progress = ProgressReporter(
+            lambda: ParticleCSVLoaderProgressDialog(filenames))
+    try:
+        spaces = map_in_pool(load_particles_from_csv, filenames, progress)
+    finally:
+        if progress is not None:
+            progress.close()
+    if spaces is None:
+        return None
+    return merge_particle_spaces(spaces)
 
 class ParticleCSVLoaderNode(PipelineNode):
     """Simple CSV loader.
     """
     INPUT_SPEC = [UriSpec]
     OUTPUT_SPEC = [ParticleSpaceSpec, NumberOfItemsSpec]
+    SPEC_DEPENDENCIES = {
+        ParticleSpaceSpec: [UriSpec], NumberOfItemsSpec: [UriSpec]}
 
     def __init__(self, *args, **kwargs):
         self._particle_space = None
@@ -89,9 +229,7 @@ class ParticleCSVLoaderNode(PipelineNode):
 
         filenames = glob.glob(fullpath)
         if len(filenames) > 1:
-            dialog = ParticleCSVLoaderProgressDialog(glob.glob(fullpath))
-            ps = dialog.Show()
-            dialog.Destroy()
+            ps = load_particles_from_csv_files(filenames)
         elif len(filenames) == 1:
             ps = load_particles_from_csv(filenames[0])
         else:
@@ -119,7 +257,7 @@ class ParticleCSVLoaderNode(PipelineNode):
                 parsed = urlparse(uri)
                 fullpath = parsed.netloc + parsed.path
                 self._particle_space = self.load_csv_file(fullpath)
-            except IOError, e:
+            except (IOError, ValueError), e:
                 warning('Failed to open %s: %s', fullpath, str(e))
                 pass
 
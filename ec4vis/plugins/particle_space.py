@@ -2,6 +2,18 @@
 """ec4vis.plugins.particle_space --- Draft implementation of ParticleSpace.
 """
 
+import numpy
+
+
+# columns of a particle record. 'sid' holds the index of the species in
+# the species table of the space.
+PARTICLE_DTYPE = numpy.dtype([
+    ('pid', numpy.int64),
+    ('sid', numpy.int32),
+    ('position', numpy.float64, (3,)),
+    ('radius', numpy.float64),
+    ('D', numpy.float64)])
+
 
 class Particle(object):
 
@@ -14,40 +26,363 @@ class Particle(object):
 # end of Particle
 
 class ParticleSpace(object):
+    """ParticleSpace backed by a structured array.
+
+    Particles are kept in one PARTICLE_DTYPE array sorted by species, so
+    that the particles of a species are a contiguous slice of it and
+    get_particles(sid) and friends return views without copying.
+    Particles added are buffered and merged on the next access.
+
+    >>> ps = ParticleSpace()
+    >>> ps.add_particle(0, Particle('A', [0.0, 0.0, 1.0], 0.5))
+    >>> ps.add_particles('B', [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]], 0.25)
+    >>> ps.add_particle(3, Particle('A', [0.0, 1.0, 0.0], 0.5))
+    >>> ps.species
+    ['A', 'B']
+    >>> ps.num_particles(), ps.num_particles('A'), ps.num_particles('C')
+    (4, 2, 0)
+    >>> ps.get_positions('A').tolist()
+    [[0.0, 0.0, 1.0], [0.0, 1.0, 0.0]]
+    >>> ps.get_radii('B').tolist()
+    [0.25, 0.25]
+    >>> [(pid, p.sid) for pid, p in ps.list_particles()]
+    [(0, 'A'), (3, 'A'), (1, 'B'), (2, 'B')]
+    >>> ps.list_particles('C') # None
+
+    """
 
     def __init__(self):
-        self.__species_pool = {}
+        # sid index -> sid, and its reverse
+        self.__species_table = []
+        self.__sid_indices = {}
+        self.__data = numpy.empty(0, dtype=PARTICLE_DTYPE)
+        # sid -> (start, stop) of its slice in self.__data
+        self.__ranges = {}
+        # chunks and single particles not merged into self.__data yet
+        self.__pending_chunks = []
+        self.__pending_particles = []
+        # one more than the largest pid added
+        self.__next_pid = 0
+        self.__time = 0
         self.static_bounds = None
 
+    def setTime(self, time):
+        self.__time = time
+
+    def getTime(self):
+        return self.__time
+
+    @property
+    def nbytes(self):
+        """Bytes held by particle data.
+        """
+        return self.__data.nbytes + sum(
+            chunk.nbytes for chunk in self.__pending_chunks) + (
+            len(self.__pending_particles) * PARTICLE_DTYPE.itemsize)
+
     @property
     def species(self):
-        if self.__species_pool is None:
-            return []
-        else:
-            return self.__species_pool.keys()
+        self.__merge_pending()
+        return [sid for sid in self.__species_table
+                if sid in self.__ranges]
+
+    def __sid_index(self, sid):
+        index = self.__sid_indices.get(sid, None)
+        if index is None:
+            index = len(self.__species_table)
+            self.__species_table.append(sid)
+            self.__sid_indices[sid] = index
+        return index
+
+    def __merge_pending(self):
+        if self.__pending_particles:
+            chunk = numpy.array(self.__pending_particles, dtype=PARTICLE_DTYPE)
+            self.__pending_chunks.append(chunk)
+            self.__pending_particles = []
+        if not self.__pending_chunks:
+            return
+        data = numpy.concatenate([self.__data] + self.__pending_chunks)
+        self.__pending_chunks = []
+        sids = data['sid']
+        if len(sids) > 1 and (sids[1:] < sids[:-1]).any():
+            # a stable sort keeps the order particles were added in.
+            data = data[numpy.argsort(sids, kind='mergesort')]
+        counts = numpy.bincount(
+            data['sid'], minlength=len(self.__species_table))
+        stops = numpy.cumsum(counts)
+        ranges = {}
+        for index, sid in enumerate(self.__species_table):
+            if counts[index] > 0:
+                ranges[sid] = (stops[index] - counts[index], stops[index])
+        self.__data = data
+        self.__ranges = ranges
 
     def add_particle(self, pid, particle):
-        if particle.sid not in self.__species_pool.keys():
-            self.__species_pool[particle.sid] = [(pid, particle)]
-        else:
-            self.__species_pool[particle.sid].append((pid, particle))
+        self.__next_pid = max(self.__next_pid, int(pid) + 1)
+        self.__pending_particles.append(
+            (pid, self.__sid_index(particle.sid), tuple(particle.position),
+             particle.radius, particle.D))
 
-    def list_particles(self, sid=None):
+    def add_particles(self, sid, positions, radii, pids=None, D=0.0):
+        """Adds particles of species sid at once.
+
+        positions is an (n, 3) array, radii and D are arrays of n or
+        scalars. pids default to serial numbers following the largest pid
+        added.
+
+        >>> ps = ParticleSpace()
+        >>> ps.add_particles('A', [[0.0, 0.0, 0.0]], 0.5, [5])
+        >>> ps.add_particles('B', [[1.0, 1.0, 1.0], [2.0, 2.0, 2.0]], 0.5)
+        >>> ps.get_pids().tolist()
+        [5, 6, 7]
+
+        """
+        positions = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3))
+        chunk = numpy.empty(len(positions), dtype=PARTICLE_DTYPE)
+        if pids is None:
+            pids = numpy.arange(self.__next_pid, self.__next_pid + len(positions))
+        chunk['pid'] = pids
+        if len(chunk) > 0:
+            self.__next_pid = max(self.__next_pid, int(chunk['pid'].max()) + 1)
+        chunk['sid'] = self.__sid_index(sid)
+        chunk['position'] = positions
+        chunk['radius'] = radii
+        chunk['D'] = D
+        self.__pending_chunks.append(chunk)
+
+    def extend(self, other):
+        """Adds all particles of another particle space, species by species.
+        """
+        for sid in other.species:
+            self.add_particles(
+                sid, other.get_positions(sid), other.get_radii(sid),
+                other.get_pids(sid), other.get_Ds(sid))
+
+    def get_particles(self, sid=None):
+        """Returns particles of species sid, or of all, as a structured array.
+
+        The array is a view into the space, and must not be modified.
+        """
+        self.__merge_pending()
         if sid is None:
-            retval = []
-            for sid, particles in self.__species_pool.items():
-                retval.extend(particles)
-            return retval
-        elif sid not in self.__species_pool:
+            return self.__data
+        start, stop = self.__ranges.get(sid, (0, 0))
+        return self.__data[start: stop]
+
+    def get_positions(self, sid=None):
+        """Returns an (n, 3) view of positions of species sid, or of all.
+        """
+        return self.get_particles(sid)['position']
+
+    def get_radii(self, sid=None):
+        return self.get_particles(sid)['radius']
+
+    def get_pids(self, sid=None):
+        return self.get_particles(sid)['pid']
+
+    def get_Ds(self, sid=None):
+        return self.get_particles(sid)['D']
+
+    def list_particles(self, sid=None):
+        """Returns a list of (pid, Particle).
+
+        This materializes a Particle for each particle, and is kept for
+        compatibility. Use get_particles() and friends for bulk access.
+        """
+        self.__merge_pending()
+        if sid is not None and sid not in self.__ranges:
             return None
-        return self.__species_pool[sid]
+        table = self.__species_table
+        return [(pid, Particle(table[sid_index], position, radius, D))
+                for pid, sid_index, position, radius, D
+                in self.get_particles(sid).tolist()]
 
     def num_particles(self, sid=None):
+        self.__merge_pending()
         if sid is None:
-            counts = [len(particles) for particles in self.__species_pool.values()]
-            return sum(counts)
-        if sid not in self.__species_pool:
+            return len(self.__data)
+        if sid not in self.__ranges:
             return 0
-        return len(self.__species_pool[sid])
+        start, stop = self.__ranges[sid]
+        return stop - start
 
 # end of ParticleSpace
+
+class ParticleSpaceView(object):
+    """Particles of some species of a particle space, picked by indices.
+
+    indices maps each sid in the view to an array of indices into the
+    particles of the species, or to None for all of them. Nothing is
+    copied until arrays of a species are asked for; they are gathered
+    from the space then and kept. Arrays of species taken whole are
+    those of the space. The view must not be modified, except for its
+    time. get_particles() is available if the space has it.
+
+    >>> ps = ParticleSpace()
+    >>> ps.add_particles('A', [[0.0, 0.0, 0.0], [1.0, 1.0, 1.0], [2.0, 2.0, 2.0]], 0.5)
+    >>> ps.add_particles('B', [[3.0, 3.0, 3.0]], 0.25)
+    >>> ps.add_particles('C', [[4.0, 4.0, 4.0]], 0.25)
+    >>> view = ParticleSpaceView(ps, {'A': numpy.array([0, 2]), 'B': None})
+    >>> view.species, view.num_particles(), view.num_particles('C')
+    (['A', 'B'], 3, 0)
+    >>> view.get_positions('A').tolist()
+    [[0.0, 0.0, 0.0], [2.0, 2.0, 2.0]]
+    >>> view.get_radii().tolist()
+    [0.5, 0.5, 0.25]
+    >>> [(pid, p.sid) for pid, p in view.list_particles()]
+    [(0, 'A'), (2, 'A'), (3, 'B')]
+    >>> view.list_particles('C') # None
+    >>> view.get_particles('A')['pid'].tolist()
+    [0, 2]
+    >>> view.setTime(1.5)
+    >>> view.getTime(), ps.getTime()
+    (1.5, 0)
+    >>> ParticleSpaceView(ps, {'B': None}).nbytes == ps.nbytes
+    True
+
+    """
+
+    def __init__(self, particle_space, indices):
+        self.particle_space = particle_space
+        self.__indices = dict(indices)
+        self.__species = [sid for sid in particle_space.species
+                          if sid in self.__indices]
+        # (getter name, sid) -> array gathered
+        self.__arrays = {}
+        self.__time = particle_space.getTime()
+        self.static_bounds = particle_space.static_bounds
+
+    def setTime(self, time):
+        self.__time = time
+
+    def getTime(self):
+        return self.__time
+
+    @property
+    def nbytes(self):
+        """Bytes held by indices, arrays gathered and the space, which the
+        view keeps alive.
+        """
+        arrays = [indices for indices in self.__indices.values()
+                  if indices is not None]
+        arrays.extend(self.__arrays.values())
+        return int(sum(array.nbytes for array in arrays)
+                   + getattr(self.particle_space, 'nbytes', 0))
+
+    @property
+    def species(self):
+        return list(self.__species)
+
+    def __gather(self, name, sid):
+        key = (name, sid)
+        array = self.__arrays.get(key, None)
+        if array is not None:
+            return array
+        if sid is None:
+            arrays = [self.__gather(name, s) for s in self.__species]
+            if len(arrays) == 1:
+                return arrays[0]
+            elif len(arrays) == 0:
+                array = getattr(self.particle_space, name)(None)[: 0]
+            else:
+                array = numpy.concatenate(arrays)
+        else:
+            values = getattr(self.particle_space, name)(sid)
+            if sid not in self.__indices:
+                return values[: 0]
+            indices = self.__indices[sid]
+            if indices is None:
+                return values
+            array = values[indices]
+        self.__arrays[key] = array
+        return array
+
+    def get_particles(self, sid=None):
+        """Returns particles of species sid, or of all, as a structured array.
+        """
+        return self.__gather('get_particles', sid)
+
+    def get_positions(self, sid=None):
+        """Returns an (n, 3) array of positions of species sid, or of all.
+        """
+        return self.__gather('get_positions', sid)
+
+    def get_radii(self, sid=None):
+        return self.__gather('get_radii', sid)
+
+    def get_pids(self, sid=None):
+        return self.__gather('get_pids', sid)
+
+    def get_Ds(self, sid=None):
+        return self.__gather('get_Ds', sid)
+
+    def list_particles(self, sid=None):
+        """Returns a list of (pid, Particle), built from the arrays.
+        """
+        if sid is not None and sid not in self.__species:
+            return None
+        sids = self.__species if sid is None else [sid]
+        retval = []
+        for s in sids:
+            retval.extend(
+                (pid, Particle(s, position, radius, D))
+                for pid, position, radius, D in zip(
+                    self.get_pids(s).tolist(), self.get_positions(s).tolist(),
+                    self.get_radii(s).tolist(), self.get_Ds(s).tolist()))
+        return retval
+
+    def num_particles(self, sid=None):
+        if sid is None:
+            return sum(self.num_particles(s) for s in self.__species)
+        if sid not in self.__indices:
+            return 0
+        indices = self.__indices[sid]
+        if indices is None:
+            return self.particle_space.num_particles(sid)
+        return len(indices)
+
+# end of ParticleSpaceView
+
+
+def merge_particle_spaces(spaces):
+    """Merges particle spaces in order into a new ParticleSpace.
+
+    None in spaces is skipped. The time of the first space is kept and
+    static bounds are united. Returns None if no space is given.
+
+    >>> ps1, ps2 = ParticleSpace(), ParticleSpace()
+    >>> ps1.add_particles('A', [[0.0, 0.0, 0.0]], 0.5, [1])
+    >>> ps2.add_particles('A', [[1.0, 1.0, 1.0]], 0.5, [2])
+    >>> ps2.add_particles('B', [[2.0, 2.0, 2.0]], 0.5, [3])
+    >>> ps1.static_bounds = [0.0, 1.0, 0.0, 1.0, 0.0, 1.0]
+    >>> ps2.static_bounds = [-1.0, 1.0, 0.0, 2.0, 0.0, 1.0]
+    >>> merged = merge_particle_spaces([ps1, None, ps2])
+    >>> merged.get_pids('A').tolist(), merged.get_pids('B').tolist()
+    ([1, 2], [3])
+    >>> merged.static_bounds
+    [-1.0, 1.0, 0.0, 2.0, 0.0, 1.0]
+    >>> merge_particle_spaces([None]) # None
+
+    """
+    spaces = [space for space in spaces if space is not None]
+    if len(spaces) == 0:
+        return None
+    merged = ParticleSpace()
+    merged.setTime(spaces[0].getTime())
+    for space in spaces:
+        merged.extend(space)
+        bounds = space.static_bounds
+        if bounds is None:
+            continue
+        elif merged.static_bounds is None:
+            merged.static_bounds = list(bounds)
+        else:
+            merged.static_bounds = [
+                f(a, b) for f, a, b
+                in zip([min, max] * 3, merged.static_bounds, bounds)]
+    return merged
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
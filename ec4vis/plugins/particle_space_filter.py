@@ -18,16 +18,32 @@ except ImportError:
 
 from ec4vis.inspector.page import InspectorPage, register_inspector_page
 from ec4vis.logger import debug, log_call, warning
-from ec4vis.pipeline import PipelineNode, PipelineSpec, UpdateEvent, UriSpec, register_pipeline_node
+from ec4vis.pipeline import PipelineNode, PipelineSpec, UpdateEvent, UriSpec, register_pipeline_node, RESULT_CACHE, parameters_outdated
 from ec4vis.pipeline.specs import NumberOfItemsSpec
 from ec4vis.plugins.particle_csv_loader import ParticleSpaceSpec
-from ec4vis.plugins.particle_space import Particle, ParticleSpace
+from ec4vis.plugins.particle_space import ParticleSpaceView
+from ec4vis.utils.decimation import DECIMATION_MODES, decimate
+
+class DecimatedIndicesSpec(PipelineSpec):
+    """Data spec for indices of particles of a species kept by decimation.
+
+    Used by ParticleSpaceFilterNode for its results in RESULT_CACHE.
+    """
+    pass
 
 class ParticleSpaceFilterNode(PipelineNode):
     """ParticleSpace filter.
     """
     INPUT_SPEC = [ParticleSpaceSpec, NumberOfItemsSpec]
     OUTPUT_SPEC = [ParticleSpaceSpec, NumberOfItemsSpec]
+    SPEC_DEPENDENCIES = {
+        ParticleSpaceSpec: ['ignore_list', 'max_num_particles', 'decimation',
+                            ParticleSpaceSpec],
+        NumberOfItemsSpec: [NumberOfItemsSpec],
+        # indices are not affected by ignore_list, so that ignoring
+        # species reuses them.
+        DecimatedIndicesSpec: ['max_num_particles', 'decimation',
+                               ParticleSpaceSpec]}
 
     def __init__(self, *args, **kwargs):
         PipelineNode.__init__(self, *args, **kwargs)
@@ -36,6 +52,8 @@ class ParticleSpaceFilterNode(PipelineNode):
         self.kwargs_cache = {}
         self.ignore_list = []
         self.max_num_particles = 10000
+        # one of DECIMATION_MODES
+        self.decimation = 'stride'
 
     @log_call
     def internal_update(self):
@@ -47,31 +65,57 @@ class ParticleSpaceFilterNode(PipelineNode):
         """Property getter for particle_space
         """
         self.kwargs_cache = kwargs
-        particle_space = self.parent.request_data(ParticleSpaceSpec, **kwargs)
+        particle_space = self.parent.request_data_cached(ParticleSpaceSpec, **kwargs)
 
         if particle_space is None:
             return None
 
         if self.sid_list is None:
-            self.update_list(**kwargs)
-
-        sids = set(particle_space.species) - set(self.ignore_list)
+            self.update_list(particle_space)
+
+        # parameters as they were when the request was made.
+        ignore_list = self.get_parameter('ignore_list')
+        max_num_particles = self.get_parameter('max_num_particles')
+        decimation = self.get_parameter('decimation')
+        sids = [sid for sid in particle_space.species
+                if sid not in ignore_list]
         if len(sids) == 0:
             return None
+        return ParticleSpaceView(
+            particle_space,
+            dict((sid, self.get_indices(particle_space, sid, **kwargs))
+                 for sid in sids))
 
-        filtered = ParticleSpace()
-        for sid in sids:
-            stride = particle_space.num_particles(sid) // self.max_num_particles + 1
-            for pid, particle in particle_space.list_particles(sid)[: : stride]:
-                filtered.add_particle(pid, particle)
-        return filtered
+    def get_indices(self, particle_space, sid, **kwargs):
+        """Returns indices of particles of species sid in particle_space,
+        requested with kwargs, to keep, or None for all of them.
 
-    def update_list(self, **kwargs):
+        Indices are kept in RESULT_CACHE as DecimatedIndicesSpec.
+        """
+        params = dict(kwargs, sid=sid)
+        found, indices = RESULT_CACHE.get(self, DecimatedIndicesSpec, params)
+        if found:
+            return indices
+        generation = RESULT_CACHE.generation(self, DecimatedIndicesSpec)
+        max_num_particles = self.get_parameter('max_num_particles')
+        if particle_space.num_particles(sid) > max_num_particles:
+            indices = decimate(
+                self.get_parameter('decimation'),
+                particle_space.get_positions(sid), max_num_particles)
+        if not parameters_outdated():
+            RESULT_CACHE.put(self, DecimatedIndicesSpec, params, indices, generation)
+        return indices
+
+    def update_list(self, particle_space=None, **kwargs):
+        """Lists species of particle_space, or of the particle space for
+        kwargs if it has been loaded, without loading it.
+        """
         if self.sid_list:
             pass
         else:
             # donot refer self.particle_space here
-            particle_space = self.parent.request_data(ParticleSpaceSpec, **kwargs)
+            if particle_space is None:
+                particle_space = self.parent.get_cached_data(ParticleSpaceSpec, **kwargs)
             if particle_space is not None:
                 self.sid_list = particle_space.species
 
@@ -108,6 +152,14 @@ class ParticleSpaceFilterInspector(InspectorPage):
             (wx.StaticText(self, -1, 'Max #'), 0, wx.ALL | wx.EXPAND),
             (self.max_num_entry, 1, wx.ALL | wx.EXPAND)])
 
+        self.decimation_choice = wx.Choice(
+            self, wx.ID_ANY, choices=DECIMATION_MODES)
+        self.decimation_choice.SetStringSelection(self.target.decimation)
+        self.decimation_choice.Bind(wx.EVT_CHOICE, self.decimation_choice_updated)
+        widgets.extend([
+            (wx.StaticText(self, -1, 'Decimation'), 0, wx.ALL | wx.EXPAND),
+            (self.decimation_choice, 1, wx.ALL | wx.EXPAND)])
+
         element_array = []
         self.listbox = wx.CheckListBox(
             self, wx.ID_ANY, choices=element_array,
@@ -132,17 +184,20 @@ class ParticleSpaceFilterInspector(InspectorPage):
             if value > 0:
                 self.max_num_entry.ChangeValue(str(value))
                 self.target.max_num_particles = value
-                self.target.internal_update()
-                for child in self.target.children:
-                    child.propagate_down(UpdateEvent(None))
+                self.target.notify_changed('max_num_particles')
             else:
                 self.max_num_entry.ChangeValue(str(self.target.max_num_particles))
         else:
             self.max_num_entry.ChangeValue(str(self.target.max_num_particles))
 
+    @log_call
+    def decimation_choice_updated(self, event):
+        self.target.decimation = self.decimation_choice.GetStringSelection()
+        self.target.notify_changed('decimation')
+
     @log_call
     def listbox_select(self, event):
-        particle_space = self.target.parent.request_data(
+        particle_space = self.target.parent.get_cached_data(
             ParticleSpaceSpec, **self.target.kwargs_cache)
         if particle_space is not None:
             idx = event.GetInt()
@@ -154,9 +209,7 @@ class ParticleSpaceFilterInspector(InspectorPage):
                 if sid not in self.target.ignore_list:
                     self.target.ignore_list.append(sid)
 
-            self.target.internal_update()
-            for child in self.target.children:
-                child.propagate_down(UpdateEvent(None))
+            self.target.notify_changed('ignore_list')
 
     @log_call
     def update(self):
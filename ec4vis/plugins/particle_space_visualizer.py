@@ -5,6 +5,7 @@ import wx, wx.aui
 import vtk
 import os
 import json
+import math
 import numpy
 import colorsys
 
@@ -24,7 +25,7 @@ from ec4vis.plugins.particle_csv_loader import ParticleSpaceSpec
 from ec4vis.visualizer.page import register_visualizer_page
 from ec4vis.visualizer.vtk3d import Vtk3dVisualizerNode
 from ec4vis.visualizer.vtk3d.page import Vtk3dVisualizerPage
-from ec4vis.visualizer.vtk3d.visual import ActorsVisual
+from ec4vis.visualizer.vtk3d.visual import ActorsVisual, create_array, update_points
 
 # def create_axes(minpos, maxpos, **params):
 def create_axes(bounds, **params):
@@ -66,6 +67,48 @@ def get_new_color(idx):
     # else:
     return (1, 1, 1)
 
+# triangles of sphere glyphs to draw in total at most, in LOD mode.
+LOD_TRIANGLE_BUDGET = 2000000
+LOD_MIN_RESOLUTION = 4
+LOD_MAX_RESOLUTION = 16
+# points drawn by LOD actors while the camera is moving.
+LOD_CLOUD_POINTS = 200000
+
+def glyph_resolution(n_particles, radius_pixels=None):
+    """Returns theta and phi resolution of sphere glyphs.
+
+    The resolution is lowered as particles increase, to keep within
+    LOD_TRIANGLE_BUDGET, and as glyphs get smaller on screen, to about
+    one segment per a few pixels of their circumference.
+
+    >>> glyph_resolution(100), glyph_resolution(10000), glyph_resolution(10 ** 6)
+    (16, 10, 4)
+    >>> glyph_resolution(100, radius_pixels=2.0), glyph_resolution(100, radius_pixels=8.0)
+    (4, 12)
+
+    """
+    resolution = LOD_MAX_RESOLUTION
+    if n_particles > 0:
+        # a sphere has about 2 * theta * phi triangles.
+        resolution = int(math.sqrt(LOD_TRIANGLE_BUDGET / (2.0 * n_particles)))
+    if radius_pixels is not None:
+        resolution = min(resolution, int(1.5 * radius_pixels))
+    return max(LOD_MIN_RESOLUTION, min(resolution, LOD_MAX_RESOLUTION))
+
+def pixels_per_unit(renderer):
+    """Returns pixels on screen per unit length at the focal point, or None.
+    """
+    camera = renderer.GetActiveCamera()
+    width, height = renderer.GetSize()
+    if camera.GetParallelProjection():
+        extent = 2.0 * camera.GetParallelScale()
+    else:
+        extent = 2.0 * camera.GetDistance() * math.tan(
+            math.radians(camera.GetViewAngle()) / 2.0)
+    if extent <= 0 or height <= 0:
+        return None
+    return height / extent
+
 class ParticlesVisual(ActorsVisual):
 
     def __init__(self, *args, **kwargs):
@@ -75,100 +118,305 @@ class ParticlesVisual(ActorsVisual):
         self.view_scale = 1e-6
         self.color_map = {}
         self._axes = None
+        # sid -> actor, kept across frames
+        self._actors_cache = {}
+        # sid -> (poly_data, source) of the actor
+        self._sources_cache = {}
+        # True if actors are behind the particle space
+        self._dirty = False
+        # sids with particles shown by species actors
+        self._shown_species = set()
+        # draws particles of all species by one actor if True
+        self.single_mapper = False
+        self.hidden_species = set()
+        self._merged_actor = None
+        # (poly_data, lookup_table) of the merged actor
+        self._merged_sources = None
+        # sid -> index into the lookup table
+        self._species_indices = {}
+        # per point species index of the merged actor
+        self._merged_species = None
+        # adapts glyphs to particle count and zoom if True
+        self.lod = False
+        # lod of the actors built
+        self._actors_lod = False
+        if self._renderer is not None:
+            # zooming changes glyph sizes on screen.
+            self._renderer.AddObserver('StartEvent', self._render_started)
+
+    def _create_actor(self, sid):
+        """Builds the glyph pipeline of a species, kept across frames.
+        """
+        poly_data = vtk.vtkPolyData()
+        poly_data.SetPoints(vtk.vtkPoints())
+
+        # source = vtk.vtkPointSource()
+        source = vtk.vtkSphereSource()
+
+        mapper = vtk.vtkGlyph3DMapper()
+        mapper.SetSourceConnection(source.GetOutputPort())
+        mapper.SetInputConnection(poly_data.GetProducerPort())
+        actor = self._new_actor()
+        actor.SetMapper(mapper)
+        self._actors_cache[sid] = actor
+        self._sources_cache[sid] = (poly_data, source)
+        return actor
+
+    def _create_merged_actor(self):
+        """Builds one glyph pipeline for particles of all species.
+
+        Points carry 'species' and 'radius' arrays: a lookup table maps
+        species to colors and glyphs are scaled by radius. Particles of
+        hidden species are left out of the points.
+        """
+        poly_data = vtk.vtkPolyData()
+        poly_data.SetPoints(vtk.vtkPoints())
+
+        source = vtk.vtkSphereSource()
+        # glyphs are scaled by the radius array.
+        source.SetRadius(1.0)
+        lookup_table = vtk.vtkLookupTable()
+
+        mapper = vtk.vtkGlyph3DMapper()
+        mapper.SetSourceConnection(source.GetOutputPort())
+        mapper.SetInputConnection(poly_data.GetProducerPort())
+        mapper.SetScaleArray('radius')
+        mapper.SetScaleModeToScaleByMagnitude()
+        mapper.SetScalarModeToUsePointFieldData()
+        mapper.SelectColorArray('species')
+        mapper.SetLookupTable(lookup_table)
+        mapper.ScalarVisibilityOn()
+        actor = self._new_actor()
+        actor.SetMapper(mapper)
+        self._merged_actor = actor
+        self._merged_sources = (poly_data, lookup_table, source)
+        return actor
+
+    def _new_actor(self):
+        """Returns an actor, which draws a cloud of points instead of
+        glyphs while the camera is moving in LOD mode.
+        """
+        if not self.lod:
+            return vtk.vtkActor()
+        actor = vtk.vtkLODActor()
+        actor.SetNumberOfCloudPoints(LOD_CLOUD_POINTS)
+        return actor
+
+    def _remove_actors(self):
+        """Drops all actors, e.g. to build them of another class.
+        """
+        actors = self._actors_cache.values()
+        if self._merged_actor is not None:
+            actors.append(self._merged_actor)
+        for actor in actors:
+            self._renderer.RemoveActor(actor)
         self._actors_cache = {}
+        self._sources_cache = {}
+        self._shown_species = set()
+        self._merged_actor = None
+        self._merged_sources = None
+        self._merged_species = None
+
+    def _iter_glyph_sources(self):
+        """Generates (sphere source, radius in view) of shown actors.
+        """
+        for sid in self._shown_species:
+            poly_data, source = self._sources_cache[sid]
+            yield source, source.GetRadius()
+        if self._merged_species is not None and len(self._merged_species) > 0:
+            poly_data, lookup_table, source = self._merged_sources
+            yield source, poly_data.GetPointData().GetArray('radius').GetRange()[1]
+
+    def update_resolution(self):
+        """Sets glyph resolution for particle count and zoom in LOD mode.
+        """
+        if not self.lod or self._dirty:
+            return
+        n_particles = 0
+        if self._merged_species is not None:
+            n_particles = len(self._merged_species)
+        for sid in self._shown_species:
+            n_particles += self.particle_space.num_particles(sid)
+        scale = None
+        if self._renderer is not None:
+            scale = pixels_per_unit(self._renderer)
+        for source, radius in self._iter_glyph_sources():
+            radius_pixels = None if scale is None else radius * scale
+            resolution = glyph_resolution(n_particles, radius_pixels)
+            # sources are executed again only if these change.
+            source.SetThetaResolution(resolution)
+            source.SetPhiResolution(resolution)
+
+    def _render_started(self, renderer, event):
+        self.update_resolution()
+
+    def _visible_species(self):
+        """Returns sids of the particle space to draw, in its order.
+        """
+        if self.particle_space is None:
+            return []
+        return [sid for sid in self.particle_space.species
+                if sid in self.color_map.keys()
+                and self.particle_space.num_particles(sid) > 0]
 
-    def _get_actors(self):
-        """override a base-class member function
+    def _update_actors(self):
+        """Updates actors of the current mode for the particle space.
+
+        Actors of the other mode are hidden, not removed.
+        """
+        if self.lod != self._actors_lod:
+            self._remove_actors()
+            self._actors_lod = self.lod
+        self._dirty = False
+        if self.single_mapper:
+            for actor in self._actors_cache.values():
+                actor.VisibilityOff()
+            self._shown_species = set()
+            self._update_merged_actor()
+        else:
+            if self._merged_actor is not None:
+                self._merged_actor.VisibilityOff()
+            self._update_species_actors()
+        self.update_resolution()
+
+    def _update_merged_actor(self):
+        """Swaps points and arrays of the merged actor.
         """
+        actor = self._merged_actor
+        if actor is None:
+            actor = self._create_merged_actor()
+        poly_data, lookup_table, source = self._merged_sources
+        sids = self._visible_species()
+        if len(sids) == 0:
+            self._merged_species = None
+            actor.VisibilityOff()
+            return
+
+        table = sorted(self.color_map.keys())
+        self._species_indices = dict((sid, i) for i, sid in enumerate(table))
+        lookup_table.SetNumberOfTableValues(len(table))
+        lookup_table.Build()
+        for i, sid in enumerate(table):
+            r, g, b = self.color_map[sid]
+            lookup_table.SetTableValue(i, r, g, b, 1.0)
+        scalar_range = (0, max(len(table) - 1, 1))
+        lookup_table.SetTableRange(*scalar_range)
+        actor.GetMapper().SetScalarRange(*scalar_range)
+
+        self._update_merged_points()
+        actor.VisibilityOn()
+
+    def _update_merged_points(self):
+        """Sets points and arrays of the merged actor to particles of
+        species not hidden.
+
+        Points are dropped rather than masked, as vtkGlyph3DMapper only
+        takes a vtkBitArray as the mask.
+        """
+        poly_data, lookup_table, source = self._merged_sources
+        ps = self.particle_space
+        sids = [sid for sid in self._visible_species()
+                if sid not in self.hidden_species]
+        counts = [ps.num_particles(sid) for sid in sids]
+        self._merged_species = numpy.repeat(
+            numpy.array([self._species_indices[sid] for sid in sids],
+                        dtype=numpy.int32), counts)
+        if len(sids) == 0:
+            radii, positions = numpy.zeros(0), numpy.zeros((0, 3))
+        else:
+            radii = numpy.concatenate(
+                [ps.get_radii(sid) for sid in sids]) / self.view_scale
+            positions = numpy.concatenate(
+                [ps.get_positions(sid) for sid in sids])
+        update_points(poly_data.GetPoints(), positions, self.view_scale)
+        point_data = poly_data.GetPointData()
+        for name, values in (('species', self._merged_species),
+                             ('radius', radii)):
+            point_data.RemoveArray(name)
+            point_data.AddArray(create_array(values, name))
+        poly_data.Modified()
+
+    def set_hidden_species(self, sids):
+        """Hides particles of species sids, without rebuilding actors.
+        """
+        self.hidden_species = set(sids)
+        if self._dirty:
+            # applied when actors are updated.
+            return
         for sid, actor in self._actors_cache.items():
-            self._renderer.RemoveActor(actor)
-        self._actors_cache.clear()
+            actor.SetVisibility(
+                sid in self._shown_species and sid not in self.hidden_species)
+        if self._merged_species is not None:
+            self._update_merged_points()
+
+    def _update_species_actors(self):
+        """Swaps points of the species actors for the current particle space.
 
+        Actors of species not shown in it are hidden, not removed.
+        """
+        self._merged_species = None
+        shown = set()
         if self.particle_space is not None:
-            # bounds = [numpy.inf, 0.0, numpy.inf, 0.0, numpy.inf, 0.0]
-            # cmap = create_color_map(len(self.particle_space.species))
-            # for i, sid in enumerate(self.particle_space.species):
-            #     color = cmap[i]
-            for sid in self.particle_space.species:
-                if sid not in self.color_map.keys():
-                    continue
-                color = self.color_map[sid]
-
-                particles = self.particle_space.list_particles(sid)
-                if len(particles) == 0:
-                    continue
-
-                points = vtk.vtkPoints()
-                radius = 0.0
-                for pid, particle in particles:
-                    points.InsertNextPoint(
-                        numpy.asarray(particle.position) / self.view_scale)
-                    radius = max(particle.radius / self.view_scale, radius)
-
-                points.ComputeBounds()
-                b = points.GetBounds()
-                # bounds = [
-                #     min(bounds[0], b[0]), max(bounds[1], b[1]),
-                #     min(bounds[2], b[2]), max(bounds[3], b[3]),
-                #     min(bounds[4], b[4]), max(bounds[5], b[5])]
-
-                poly_data = vtk.vtkPolyData()
-                poly_data.SetPoints(points)
-
-                # source = vtk.vtkPointSource()
-                # source.SetRadius(radius)
-                source = vtk.vtkSphereSource()
-                source.SetRadius(radius)
-
-                mapper = vtk.vtkGlyph3DMapper()
-                mapper.SetSourceConnection(source.GetOutputPort())
-                mapper.SetInputConnection(poly_data.GetProducerPort())
-                actor = vtk.vtkActor()
-                actor.SetMapper(mapper)
-                actor.GetProperty().SetColor(color)
-                self._actors_cache[sid] = actor
-
-        debug('actors: %s' % self._actors_cache)
-        return self._actors_cache
+            for sid in self._visible_species():
+                actor = self._actors_cache.get(sid, None)
+                if actor is None:
+                    actor = self._create_actor(sid)
+                poly_data, source = self._sources_cache[sid]
+                update_points(
+                    poly_data.GetPoints(),
+                    self.particle_space.get_positions(sid), self.view_scale)
+                poly_data.Modified()
+                radius = self.particle_space.get_radii(sid).max() / self.view_scale
+                if source.GetRadius() != radius:
+                    source.SetRadius(radius)
+                actor.GetProperty().SetColor(self.color_map[sid])
+                shown.add(sid)
+
+        self._shown_species = shown
+        for sid, actor in self._actors_cache.items():
+            actor.SetVisibility(
+                sid in shown and sid not in self.hidden_species)
+
+    def _get_actors(self):
+        """override a base-class member function
+        """
+        if self._dirty:
+            self._update_actors()
+        actors = dict(self._actors_cache)
+        if self._merged_actor is not None:
+            actors[None] = self._merged_actor
+        debug('actors: %s' % actors)
+        return actors
 
     def get_bounds(self):
-        if self.particle_space is not None:
-            if self.particle_space.static_bounds is not None:
-                bounds = numpy.array(self.particle_space.static_bounds) / self.view_scale
-                return bounds
-            else:
-                bounds = [numpy.inf, 0.0, numpy.inf, 0.0, numpy.inf, 0.0]
-            for sid in self.particle_space.species:
-                if sid not in self.color_map.keys():
-                    continue
-
-                particles = self.particle_space.list_particles(sid)
-                if len(particles) == 0:
-                    continue
-
-                points = vtk.vtkPoints()
-                for pid, particle in particles:
-                    points.InsertNextPoint(
-                        numpy.asarray(particle.position) / self.view_scale)
-
-                points.ComputeBounds()
-                b = points.GetBounds()
-                bounds = [
-                    min(bounds[0], b[0]), max(bounds[1], b[1]),
-                    min(bounds[2], b[2]), max(bounds[3], b[3]),
-                    min(bounds[4], b[4]), max(bounds[5], b[5])]
-            return bounds
-        else:
+        """Returns bounds of the particles shown, or None.
+        """
+        if self.particle_space is None:
+            return None
+        if self.particle_space.static_bounds is not None:
+            return numpy.array(self.particle_space.static_bounds) / self.view_scale
+        sids = self._visible_species()
+        if len(sids) == 0:
             return None
+        lower = numpy.min(
+            [self.particle_space.get_positions(sid).min(axis=0) for sid in sids],
+            axis=0)
+        upper = numpy.max(
+            [self.particle_space.get_positions(sid).max(axis=0) for sid in sids],
+            axis=0)
+        # (xmin, xmax, ymin, ymax, zmin, zmax)
+        return numpy.column_stack((lower, upper)).ravel() / self.view_scale
 
     def reset_actors(self, data):
-        for actor in self._actors_cache.values():
-            self._renderer.RemoveActor(actor)
-        self._actors_cache = {}
-
+        """Sets data to show. Actors are updated in place when next used.
+        """
         self.particle_space = data['particle_space']
         self.view_scale = data['view_scale']
         self.color_map = data['color_map']
+        self.single_mapper = data.get('single_mapper', False)
+        self.lod = data.get('lod', False)
+        self.hidden_species = set(data.get('hidden_species', ()))
+        self._dirty = True
 
 class ParticleSpaceVisualizerNode(Vtk3dVisualizerNode):
     """
@@ -186,10 +434,29 @@ class ParticleSpaceVisualizerNode(Vtk3dVisualizerNode):
 
         self.view_scale = 1e-6
         self.sid_color_map = None
+        # draws all species by one glyph mapper if True
+        self.single_mapper = False
+        # adapts glyph resolution to particle count and zoom if True
+        self.lod = False
+        self.hidden_species = set()
         self.time = 0
         self.index = 0
         self.max_index = 0
         self.__axes = None
+        # True while the frame at index is being loaded
+        self.loading = False
+        self._future = None
+
+    def handle_downward_event(self, pipeline_event):
+        """Masks species hidden without loading particles again.
+        """
+        if isinstance(pipeline_event, UpdateEvent):
+            changed = pipeline_event.get_changed_inputs(self)
+            if changed is not None and changed <= set(['hidden_species']):
+                self.particles_visual.set_hidden_species(self.hidden_species)
+                self.update_observers()
+                return
+        Vtk3dVisualizerNode.handle_downward_event(self, pipeline_event)
 
     @log_call
     def internal_update(self):
@@ -198,36 +465,86 @@ class ParticleSpaceVisualizerNode(Vtk3dVisualizerNode):
         # self.view_scale = 1e-6
         # self.sid_color_map = None
 
-        kwargs = {'index':self.index}
-        ps = self.fetch_particle_space(**kwargs)
-        self.max_index = self.parent.request_data(NumberOfItemsSpec)
-        self.time = ps.getTime()
+        if self._future is not None:
+            # the frame requested before is not wanted any more.
+            self._future.cancel()
+            self._future = None
+        future = self.run_async(self.fetch_frame, self.index)
+        if future.done():
+            self.show_frame(future.result())
+        else:
+            # the previous frame is kept shown until this arrives.
+            self.loading = True
+            self._future = future
+            future.add_done_callback(self.frame_arrived)
+
+    def fetch_frame(self, index):
+        """Requests the particle space at index and the number of items.
+
+        This may run on the worker thread, so it only reads from the
+        pipeline; the species list is updated by show_frame().
+        """
+        ps = self.fetch_particle_space(index=index)
+        max_index = self.parent.request_data(NumberOfItemsSpec)
+        return (ps, max_index)
+
+    @log_call
+    def frame_arrived(self, future):
+        """Called on the GUI thread when a frame requested is loaded.
+        """
+        if future is not self._future:
+            return
+        self._future = None
+        try:
+            frame = future.result()
+        except Exception, e:
+            warning('Failed to load index=%s: %s', self.index, str(e))
+            frame = (None, self.max_index)
+        self.show_frame(frame)
+        self.update_observers()
+
+    def show_frame(self, frame):
+        """Sets up actors for a frame given by fetch_frame().
+        """
+        ps, max_index = frame
+        self.loading = False
+        self.max_index = max_index
+        if ps is not None:
+            self.time = ps.getTime()
+            self.update_list(ps)
         self.particles_visual.reset_actors(
             dict(particle_space = ps,
                  view_scale = self.view_scale,
-                 color_map = self.sid_color_map))
+                 color_map = self.sid_color_map,
+                 single_mapper = self.single_mapper,
+                 lod = self.lod,
+                 hidden_species = self.hidden_species))
         self.particles_visual.enable()
 
         bounds = self.particles_visual.get_bounds()
         if bounds is not None:
             self.renderer.ResetCamera(bounds)
-            if self.__axes is not None:
-                self.renderer.RemoveViewProp(self.__axes)
-            self.__axes = create_axes(bounds)
-            self.__axes.SetCamera(self.renderer.GetActiveCamera())
-            self.renderer.AddViewProp(self.__axes)
+            if self.__axes is None:
+                self.__axes = create_axes(bounds)
+                self.__axes.SetCamera(self.renderer.GetActiveCamera())
+                self.renderer.AddViewProp(self.__axes)
+            else:
+                # the axes actor is kept across frames.
+                self.__axes.SetBounds(bounds)
+                self.__axes.SetRanges(bounds)
 
     @log_call
     def fetch_particle_space(self, **kwargs):
-        ps = self.parent.request_data(ParticleSpaceSpec, **kwargs)
-        if ps is not None:
-            self.update_list(**kwargs)
-            self.index = 0
-        return ps
+        return self.parent.request_data_cached(ParticleSpaceSpec, **kwargs)
 
     @log_call
-    def update_list(self, **kwargs):
-        ps = self.parent.request_data(ParticleSpaceSpec, **kwargs)
+    def update_list(self, ps=None, **kwargs):
+        """Adds colors for species of ps, or of the particle space
+        requested with kwargs if it has been loaded. Call this on the
+        GUI thread.
+        """
+        if ps is None:
+            ps = self.parent.get_cached_data(ParticleSpaceSpec, **kwargs)
         if ps is None:
             return
 
@@ -280,13 +597,21 @@ class ParticleSpaceVisualizerInspector(InspectorPage):
         self.time_widget = wx.TextCtrl(
             self, wx.ID_ANY, "0", style=wx.TE_PROCESS_ENTER)
         self.time_widget.Disable()
+        self.single_mapper_checkbox = wx.CheckBox(self, wx.ID_ANY, 'Single mapper')
+        self.single_mapper_checkbox.Bind(wx.EVT_CHECKBOX, self.single_mapper_updated)
+        self.lod_checkbox = wx.CheckBox(self, wx.ID_ANY, 'Level of detail')
+        self.lod_checkbox.Bind(wx.EVT_CHECKBOX, self.lod_updated)
         widgets.extend([
             (wx.StaticText(self, -1, 'Scale :'), 0, wx.ALL | wx.EXPAND),
             (self.view_scale_entry, 1, wx.ALL | wx.EXPAND),
             (wx.StaticText(self, -1, 'Index :'), 0, wx.ALL | wx.EXPAND),
             (self.index_widget, 1, wx.ALL | wx.EXPAND),
             (wx.StaticText(self, -1, 'Time :'), 0, wx.ALL | wx.EXPAND),
-            (self.time_widget, 1, wx.ALL | wx.EXPAND)])
+            (self.time_widget, 1, wx.ALL | wx.EXPAND),
+            (wx.StaticText(self, -1, 'Mode :'), 0, wx.ALL | wx.EXPAND),
+            (self.single_mapper_checkbox, 1, wx.ALL | wx.EXPAND),
+            ((0, 0), 0, wx.ALL | wx.EXPAND),
+            (self.lod_checkbox, 1, wx.ALL | wx.EXPAND)])
 
         element_array = []
         self.listbox = wx.CheckListBox(
@@ -359,31 +684,40 @@ class ParticleSpaceVisualizerInspector(InspectorPage):
         if value > 0:
             self.view_scale_entry.ChangeValue(str(value))
             self.target.view_scale = value
-            # self.target.internal_update()
-            self.target.status_changed()
-            for child in self.target.children:
-                child.propagate_down(UpdateEvent(None))
+            # particles are rescaled without loading them again.
+            self.target.notify_changed('view_scale')
         else:
             self.view_scale_entry.ChangeValue(str(self.target.view_scale))
 
     @log_call
     def index_updated(self, event):
         self.target.index = self.index_widget.GetValue()
-        self.target.status_changed()
+        # dragging the slider shows the latest index once per frame.
+        self.target.schedule_status_changed()
 
     @log_call
     def refresh_button_pressed(self, event):
         self.target.sid_color_map = None
         self.target.update_list()
-        self.target.status_changed()
-        for child in self.target.children:
-            child.propagate_down(UpdateEvent(None))
+        self.target.notify_changed('sid_color_map')
+
+    @log_call
+    def single_mapper_updated(self, event):
+        self.target.single_mapper = self.single_mapper_checkbox.GetValue()
+        self.target.notify_changed('single_mapper')
+
+    @log_call
+    def lod_updated(self, event):
+        self.target.lod = self.lod_checkbox.GetValue()
+        self.target.notify_changed('lod')
 
     @log_call
     def listbox_select(self, event):
-        #TODO
-        checked = self.listbox.GetChecked()
-        debug(checked)
+        self.target.hidden_species = set(
+            self.listbox.GetString(i) for i in range(self.listbox.GetCount())
+            if not self.listbox.IsChecked(i))
+        # species are hidden, actors are kept.
+        self.target.notify_changed('hidden_species')
 
     def listbox_right_down(self, event):
         popupmenu = wx.Menu()
@@ -410,9 +744,7 @@ class ParticleSpaceVisualizerInspector(InspectorPage):
                 sid = self.listbox.GetString(idx)
                 self.target.sid_color_map[sid] = newcolor
 
-            self.target.status_changed()
-            for child in self.target.children:
-                child.propagate_down(UpdateEvent(None))
+            self.target.notify_changed('sid_color_map')
         dlg.Destroy()
 
     @log_call
@@ -440,10 +772,15 @@ class ParticleSpaceVisualizerInspector(InspectorPage):
             self.listbox.Clear()
             self.listbox.SetItems(sp_list)
             for i, sid in enumerate(sp_list):
-                self.listbox.Check(i, True)
+                self.listbox.Check(i, sid not in self.target.hidden_species)
                 c = tuple([int(x * 255) for x in self.target.sid_color_map[sid]])
                 self.listbox.SetItemForegroundColour(i, c)
-        self.time_widget.SetValue(str(self.target.time))
+        self.single_mapper_checkbox.SetValue(self.target.single_mapper)
+        self.lod_checkbox.SetValue(self.target.lod)
+        if self.target.loading:
+            self.time_widget.SetValue('Loading...')
+        else:
+            self.time_widget.SetValue(str(self.target.time))
         self.index_widget.SetMax(self.target.max_index-1)
 
         """Called on any status_change() on PipelineNode.
@@ -533,7 +870,7 @@ class ParticleSpaceVisualizerInspector(InspectorPage):
                 self.params_from_camera()
             except Exception, e:
                 debug('Import failed due to %s' %(str(e)))
-            self.target.propagate_down(UpdateEvent(None))
+            self.target.notify_changed('camera')
 
     @log_call
     def OnExportButton(self, evt):
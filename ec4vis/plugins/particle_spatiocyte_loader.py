@@ -3,11 +3,15 @@
 """
 import os.path
 import re
+import tempfile
 import glob
 from urlparse import urlparse
 import wx, wx.aui
 
 import struct
+import mmap
+import threading
+import numpy
 
 # this allows module-wise execution
 try:
@@ -17,12 +21,15 @@ except ImportError:
     p = os.path.abspath(__file__); sys.path.insert(0, p[: p.rindex(os.sep + 'ec4vis')])
 
 from ec4vis.logger import debug, log_call, warning
-from ec4vis.pipeline import PipelineNode, PipelineSpec, UpdateEvent, UriSpec, register_pipeline_node
+from ec4vis.pipeline import PipelineNode, PipelineSpec, ProgressReporter, UpdateEvent, UriSpec, can_show_dialogs, register_pipeline_node
 from ec4vis.pipeline.specs import NumberOfItemsSpec
 
 from ec4vis.plugins.particle_csv_loader import ParticleSpaceSpec
 
-from ec4vis.plugins.lattice_space import LatticeParticle, OffLatticeParticle, LatticeParticleSpace
+from ec4vis.plugins.lattice_space import LatticeParticleSpace, offset_pids
+from ec4vis.plugins.particle_space import merge_particle_spaces
+from ec4vis.utils.pool import map_in_pool
+from ec4vis.utils.prefetch import Prefetcher
 
 class SpatiocyteLogReadingException(Exception):
     def __init__(self, value):
@@ -31,20 +38,122 @@ class SpatiocyteLogReadingException(Exception):
     def __str__(self):
         return repr(self.value)
 
+# sidecar file holding the frame offset table of a log.
+INDEX_FILE_SUFFIX = '.idx'
+INDEX_FILE_MAGIC = 'EC4VIDX1'
+# magic, size and mtime of the indexed log, number of frames
+INDEX_FILE_HEADER = struct.Struct('<8sQdQ')
+# byte offset and timestamp per frame
+FRAME_INDEX_DTYPE = numpy.dtype([('offset', '<u8'), ('time', '<f8')])
+# voxel coordinates and (x, y, z) points as written in the log
+COORD_DTYPE = numpy.dtype('<u4')
+POINT_DTYPE = numpy.dtype('<f8')
+
 class SpatiocyteLogReader:
+    """Reads frames of a Spatiocyte visual log.
+
+    Frames are found through the frame offset table, which is kept in
+    a sidecar file next to the log.
+
+    >>> import shutil
+    >>> test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    ...                         os.pardir, os.pardir, 'scripts', 'test')
+    >>> tmp_dir = tempfile.mkdtemp()
+    >>> logfile = os.path.join(tmp_dir, 'VisualLog_MinD.dat')
+    >>> shutil.copy(os.path.join(test_dir, 'VisualLog_MinD.dat'), logfile)
+    >>> reader = SpatiocyteLogReader(logfile)
+    >>> frames = reader.getFrameIndex()
+    >>> len(frames), map(int, frames['offset'][:3]), frames['time'][:3].tolist()
+    (21, [234, 3082, 7282], [0.0, 0.5, 1.0])
+
+    The table is read back from the sidecar file.
+
+    >>> reader.close()
+    >>> reader = SpatiocyteLogReader(logfile)
+    >>> (reader.loadIndex() == frames).all()
+    True
+
+    Frames appended to the log are added by refreshIndex().
+
+    >>> fin = open(logfile, 'rb')
+    >>> last = fin.read()[int(frames['offset'][-1]):]
+    >>> fin.close()
+    >>> fout = open(logfile, 'ab')
+    >>> fout.write(last)
+    >>> fout.close()
+    >>> frames = reader.refreshIndex()
+    >>> len(frames), int(frames['offset'][-1]) == reader.footerSeek - len(last)
+    (22, True)
+    >>> (reader.loadIndex() == frames).all()
+    True
+    >>> ps, last_ps = reader.skipSpeciesTo(20), reader.skipSpeciesTo(21)
+    >>> all((ps.get_positions(sid) == last_ps.get_positions(sid)).all()
+    ...     for sid in ps.species)
+    True
+    >>> reader.close()
+    >>> shutil.rmtree(tmp_dir)
+
+    Reading through a map decodes the same arrays as reading the file.
+
+    >>> logfile = os.path.join(test_dir, 'VisualLog_OffLattice.dat')
+    >>> reader = SpatiocyteLogReader(logfile, use_index_file=False)
+    >>> mapped = SpatiocyteLogReader(logfile, use_index_file=False, use_mmap=True)
+    >>> mapped.isMapped()
+    True
+    >>> ps, mapped_ps = reader.skipSpeciesTo(10), mapped.skipSpeciesTo(10)
+    >>> ps.species == mapped_ps.species
+    True
+    >>> all((ps.get_positions(sid) == mapped_ps.get_positions(sid)).all()
+    ...     for sid in ps.species)
+    True
+    >>> reader.close()
+    >>> mapped.close()
+
+    """
 
-    def __init__(self, logfile):
-        self.logfile = open(logfile, 'rb')
+    def __init__(self, logfile, use_index_file=True, use_mmap=False):
+        self.filename = logfile
+        self.use_index_file = use_index_file
+        self._file = open(logfile, 'rb')
+        self._mmap = None
+        self.logfile = self._file
+        if use_mmap:
+            self.mapFile()
         self.readInitialization()
         self.readCompVacant()
         self.headerSeek = self.tell()
         self.logfile.seek(0,2)
         self.footerSeek = self.tell()
         self.logfile.seek(self.headerSeek)
-        self._indexSize = -1
+        self._frames = None
 
     def close(self):
-        self.logfile.close()
+        # arrays read in mmap mode still refer to the map, which is
+        # released when the last of them is gone.
+        self._mmap = None
+        self.logfile = self._file
+        self._file.close()
+
+    def mapFile(self):
+        '''
+        maps the whole log into memory. the log is then read through the
+        map, and coordinates and points are numpy views into it.
+        falls back to plain file reads if the log cannot be mapped.
+        '''
+        currentSeek = self.tell()
+        try:
+            self._mmap = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError, OverflowError), e:
+            warning('Failed to map %s: %s', self.filename, str(e))
+            self._mmap = None
+            self.logfile = self._file
+            return
+        self.logfile = self._mmap
+        self.logfile.seek(currentSeek)
+
+    def isMapped(self):
+        return self._mmap is not None
 
     def tell(self):
         return self.logfile.tell()
@@ -53,14 +162,157 @@ class SpatiocyteLogReader:
         return self.tell() == self.footerSeek
 
     def getIndexSize(self):
-        if self._indexSize != -1:
-            return self._indexSize
-        count = 0
-        while True:
-            self.skipSpecies()
-            count += 1
-            if self.isEnd():
-                return count
+        return len(self.getFrameIndex())
+
+    def getFrameIndex(self):
+        '''
+        returns the frame offset table, a FRAME_INDEX_DTYPE array.
+        the table is loaded from the sidecar file if it is up to date,
+        or built by scanning the log once otherwise.
+        '''
+        if self._frames is None:
+            frames = None
+            if self.use_index_file:
+                frames = self.loadIndex()
+            if frames is None:
+                frames = self.buildIndex()
+                if self.use_index_file:
+                    self.saveIndex(frames)
+            self._frames = frames
+        return self._frames
+
+    def getIndexFilename(self):
+        return self.filename + INDEX_FILE_SUFFIX
+
+    def getLogStat(self):
+        stat = os.fstat(self._file.fileno())
+        return (stat.st_size, stat.st_mtime)
+
+    def buildIndex(self, startSeek=None):
+        '''
+        scans the log once from startSeek (the first frame by default),
+        recording the byte offset and the timestamp of each frame.
+        a truncated frame at the end is ignored.
+        '''
+        if startSeek is None:
+            startSeek = self.headerSeek
+        currentSeek = self.tell()
+        offsets = []
+        times = []
+        self.logfile.seek(startSeek)
+        try:
+            while self.tell() < self.footerSeek:
+                offset = self.tell()
+                aCurrentTime = struct.unpack('d', self.logfile.read(8))[0]
+                self.logfile.seek(offset)
+                self.skipSpecies()
+                if self.tell() > self.footerSeek:
+                    break
+                offsets.append(offset)
+                times.append(aCurrentTime)
+        except (struct.error, ValueError):
+            # a frame still being written
+            pass
+        finally:
+            self.logfile.seek(currentSeek)
+
+        frames = numpy.empty(len(offsets), dtype=FRAME_INDEX_DTYPE)
+        frames['offset'] = offsets
+        frames['time'] = times
+        return frames
+
+    def loadIndex(self):
+        '''
+        reads the frame offset table from the sidecar file.
+        returns None if the file is missing or does not match the log.
+        '''
+        filename = self.getIndexFilename()
+        if not os.path.isfile(filename):
+            return None
+        (size, mtime) = self.getLogStat()
+        try:
+            fin = open(filename, 'rb')
+            try:
+                header = fin.read(INDEX_FILE_HEADER.size)
+                if len(header) != INDEX_FILE_HEADER.size:
+                    return None
+                (magic, aSize, aMtime, count) = INDEX_FILE_HEADER.unpack(header)
+                if (magic != INDEX_FILE_MAGIC
+                    or aSize != size or aMtime != mtime):
+                    return None
+                frames = numpy.fromfile(fin, dtype=FRAME_INDEX_DTYPE, count=count)
+            finally:
+                fin.close()
+        except IOError, e:
+            warning('Failed to read %s: %s', filename, str(e))
+            return None
+        if len(frames) != count:
+            return None
+        return frames
+
+    def saveIndex(self, frames):
+        '''
+        writes the frame offset table to the sidecar file.
+        the table is written to a temporary file first, so that readers
+        of the log in other threads never see a partial one.
+        '''
+        filename = self.getIndexFilename()
+        (size, mtime) = self.getLogStat()
+        try:
+            (fd, tmpname) = tempfile.mkstemp(
+                prefix=os.path.basename(filename), dir=os.path.dirname(filename))
+            fout = os.fdopen(fd, 'wb')
+            try:
+                fout.write(INDEX_FILE_HEADER.pack(
+                        INDEX_FILE_MAGIC, size, mtime, len(frames)))
+                frames.tofile(fout)
+            finally:
+                fout.close()
+            try:
+                os.rename(tmpname, filename)
+            except OSError:
+                os.remove(tmpname)
+                raise
+        except (IOError, OSError), e:
+            warning('Failed to write %s: %s', filename, str(e))
+
+    def refreshIndex(self):
+        '''
+        extends the frame offset table with the frames appended to the log
+        since it was indexed, e.g. by a running simulation.
+        '''
+        frames = self.getFrameIndex()
+        (size, mtime) = self.getLogStat()
+        if size == self.footerSeek:
+            return frames
+
+        if self.isMapped():
+            # the map covers the log size at the time it was made.
+            self.mapFile()
+
+        if size < self.footerSeek:
+            # the log was truncated or rewritten, start over.
+            self.footerSeek = size
+            frames = self.buildIndex()
+        else:
+            if len(frames) == 0:
+                startSeek = self.headerSeek
+            else:
+                currentSeek = self.tell()
+                self.logfile.seek(int(frames['offset'][-1]))
+                self.skipSpecies()
+                startSeek = self.tell()
+                self.logfile.seek(currentSeek)
+            self.footerSeek = size
+            frames = numpy.concatenate((frames, self.buildIndex(startSeek)))
+
+        if self.use_index_file:
+            self.saveIndex(frames)
+        self._frames = frames
+        return frames
+
+    def getTimeAt(self, index):
+        return self.getFrameIndex()['time'][index]
 
 
     def readInitialization(self):
@@ -148,11 +400,8 @@ class SpatiocyteLogReader:
                 break
             lattices = {}
             lattices['index'] = i
-            lattices['Coords'] = []
             aSize = struct.unpack('i', self.logfile.read(4))[0]
-            for j in range(aSize):
-                aCoord = struct.unpack('I', self.logfile.read(4))
-                lattices['Coords'].append(aCoord)
+            lattices['Coords'] = self.readCoords(aSize)
             data['Lattice'].append(lattices)
 
         data['OffLattice'] = []
@@ -162,11 +411,8 @@ class SpatiocyteLogReader:
                 break
             offlattices = {}
             offlattices['index'] = i
-            offlattices['Points'] = []
             aSize = struct.unpack('i', self.logfile.read(4))[0]
-            for j in range(aSize):
-                (x, y, z) = struct.unpack('ddd', self.logfile.read(8*3))
-                offlattices['Points'].append((x, y, z))
+            offlattices['Points'] = self.readPoints(aSize)
             data['OffLattice'].append(offlattices)
 
         self.header['compVacant'] = data
@@ -232,22 +478,14 @@ class SpatiocyteLogReader:
                 voxel_radius, lattice_species, offlattice_species)
 
         for sp in self.header['compVacant']['Lattice']:
-            sid = sp['index']
-            for coord in sp['Coords']:
-                ps.add_particle(LatticeParticle(sid, coord))
+            ps.add_coords(sp['index'], sp['Coords'])
         for sp in self.header['compVacant']['OffLattice']:
-            sid = sp['index']
-            for point in sp['Points']:
-                ps.add_particle(OffLatticeParticle(sid, point))
+            ps.add_points(sp['index'], sp['Points'])
 
         for sp in data['Lattice']:
-            sid = sp['index']
-            for coord in sp['Coords']:
-                ps.add_particle(LatticeParticle(sid, coord))
+            ps.add_coords(sp['index'], sp['Coords'])
         for sp in data['OffLattice']:
-            sid = sp['index']
-            for point in sp['Points']:
-                ps.add_particle(OffLatticeParticle(sid, point))
+            ps.add_points(sp['index'], sp['Points'])
 
         ps.setTime(data['theCurrentTime'])
         col = self.header['aRealColSize'] * 2 * ps.voxel_radius
@@ -290,19 +528,50 @@ class SpatiocyteLogReader:
 
 
     def skipSpeciesTo(self, index):
-        currentSeek = self.tell()
-        self.logfile.seek(self.headerSeek)
-
-        for i in range(index):
-            self.skipSpecies()
-            if self.isEnd():
-                self.logfile.seek(currentSeek)
-                raise SpatiocyteLogReadingException('[ERROR]\t'+index+' is out of bound')
+        frames = self.getFrameIndex()
+        if index >= len(frames):
+            frames = self.refreshIndex()
+        if not (0 <= index < len(frames)):
+            raise SpatiocyteLogReadingException(
+                '[ERROR]\t%d is out of bound' % index)
+        self.logfile.seek(int(frames['offset'][index]))
 
         ps = self.readSpecies()
         ps.__index = index;
         return ps
 
+    def readCoords(self, size):
+        '''
+        read size voxel coordinates at once into a uint32 array
+        '''
+        if self.isMapped():
+            return self.viewArray(COORD_DTYPE, size)
+        return numpy.frombuffer(
+            self.logfile.read(COORD_DTYPE.itemsize * size), dtype=COORD_DTYPE)
+
+    def readPoints(self, size):
+        '''
+        read size (x, y, z) points at once into a (size, 3) float64 array
+        '''
+        if self.isMapped():
+            return self.viewArray(POINT_DTYPE, 3 * size).reshape((size, 3))
+        return numpy.frombuffer(
+            self.logfile.read(POINT_DTYPE.itemsize * 3 * size),
+            dtype=POINT_DTYPE).reshape((size, 3))
+
+    def viewArray(self, dtype, count):
+        '''
+        returns count items at the current position as a view into the
+        map, without copying, and moves past them
+        '''
+        offset = self.tell()
+        if count == 0:
+            return numpy.empty(0, dtype=dtype)
+        array = numpy.frombuffer(
+            self._mmap, dtype=dtype, count=count, offset=offset)
+        self.logfile.seek(dtype.itemsize * count, 1)
+        return array
+
     def readMolecules(self):
         '''
         read aSpecies->getCoord(i) i(0:aSpecies->size())
@@ -310,10 +579,7 @@ class SpatiocyteLogReader:
         molecules = {}
         (index, size) = struct.unpack('ii', self.logfile.read(8))
         molecules['index'] = index
-        molecules['Coords'] = []
-        for i in range(size):
-            aCoord = struct.unpack('I', self.logfile.read(4))[0]
-            molecules['Coords'].append(aCoord)
+        molecules['Coords'] = self.readCoords(size)
         return molecules
 
 
@@ -330,10 +596,7 @@ class SpatiocyteLogReader:
         data = {}
         (aSourceIndex, aSize) = struct.unpack('ii', self.logfile.read(8))
         data['index'] = aSourceIndex
-        data['Coords'] = []
-        for i in range(aSize):
-            aCoord = struct.unpack('I', self.logfile.read(4))[0]
-            data['Coords'].append(aCoord)
+        data['Coords'] = self.readCoords(aSize)
         return data
 
 
@@ -350,14 +613,11 @@ class SpatiocyteLogReader:
         data = {}
         (aTargetIndex, aSize) = struct.unpack('ii', self.logfile.read(8))
         data['index'] = aTargetIndex
-        data['Coords'] = []
-        for i in range(aSize):
-            aCoord = struct.unpack('I', self.logfile.read(4))[0]
-            data['Coords'].append(aCoord)
+        data['Coords'] = self.readCoords(aSize)
         return data
 
 
-    def readTargetMolecules(self):
+    def skipTargetMolecules(self):
         self.logfile.seek(4,1)
         size = struct.unpack('i', self.logfile.read(4))[0]
         self.logfile.seek(4*size,1)
@@ -370,10 +630,7 @@ class SpatiocyteLogReader:
         data = {}
         (aSharedIndex, aSize) = struct.unpack('ii', self.logfile.read(8))
         data['index'] = aSharedIndex
-        data['Coords'] = []
-        for i in range(aSize):
-            aCoord = struct.unpack('I', self.logfile.read(4))[0]
-            data['Coords'].append(aCoord)
+        data['Coords'] = self.readCoords(aSize)
         return data
 
     def skipSharedMolecules(self):
@@ -389,10 +646,7 @@ class SpatiocyteLogReader:
         data = {}
         (anIndex, aSize) = struct.unpack('ii', self.logfile.read(8))
         data['index'] = anIndex
-        data['Points'] = []
-        for i in range(aSize):
-            (x, y, z) = struct.unpack('ddd', self.logfile.read(8*3))
-            data['Points'].append({'x':x, 'y':y, 'z':z})
+        data['Points'] = self.readPoints(aSize)
         return data
 
     def skipPolymers(self):
@@ -406,12 +660,8 @@ class SpatiocyteLogReader:
         read aSpecies->getPoint(i)
         or  aSpecies->getMultiscaleStructurePoint(i) i(0:aSpecies->size())
         '''
-        points=[]
         aSize = struct.unpack('i', self.logfile.read(4))[0]
-        for i in range(aSize):
-            (x, y, z) = struct.unpack('ddd', self.logfile.read(8*3))
-            points.append((x, y, z))
-        return points
+        return self.readPoints(aSize)
 
     def skipOffLattice(self):
         size = struct.unpack('i', self.logfile.read(4))[0]
@@ -432,41 +682,138 @@ def load_particles_from_spatiocyte(filename, index=0, ps=None):
             reader.close()
     return ps
 
+def load_particles_from_spatiocyte_frame(args):
+    """Calls load_particles_from_spatiocyte with (filename, index).
+
+    This takes a single argument to be mapped in a process pool.
+    """
+    filename, index = args
+    return load_particles_from_spatiocyte(filename, index)
+
 class ParticleSpatiocyteLoaderProgressDialog(wx.ProgressDialog):
 
     def __init__(self, filenames):
         wx.ProgressDialog.__init__(
             self, "Loading ...",
             "File remaining", len(filenames),
-            style=wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME | wx.PD_AUTO_HIDE)
+            style=wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME | wx.PD_AUTO_HIDE
+            | wx.PD_CAN_ABORT)
 
         self.filenames = filenames
-        self.index = 0
 
-    def Show(self):
-        for i, filename in enumerate(self.filenames):
-            ps = load_particles_from_spatiocyte(filename, self.index)
-            if not self.Update(i):
-                return None
-        return ps
+def load_particles_from_spatiocyte_files(filenames, index):
+    """Loads the frame at index of the logs in worker processes and merges
+    them in order. Returns None if cancelled.
+
+    Progress is shown in a dialog on the GUI thread, if dialogs may be
+    shown.
+    """
+    progress = None
+    if can_show_dialogs():
+        progress = ProgressReporter(
+            lambda: ParticleSpatiocyteLoaderProgressDialog(filenames))
+    try:
+        spaces = map_in_pool(
+            load_particles_from_spatiocyte_frame,
+            [(filename, index) for filename in filenames], progress)
+    finally:
+        if progress is not None:
+            progress.close()
+    if spaces is None:
+        return None
+    offset_pids(spaces)
+    return merge_particle_spaces(spaces)
 
 class ParticleSpatiocyteLoaderNode(PipelineNode):
     """Simple Spatiocyte loader.
     """
     INPUT_SPEC = [UriSpec]
     OUTPUT_SPEC = [ParticleSpaceSpec, NumberOfItemsSpec]
+    SPEC_DEPENDENCIES = {
+        ParticleSpaceSpec: [UriSpec], NumberOfItemsSpec: [UriSpec]}
+    # frames ahead of the current one loaded in background
+    PREFETCH_DEPTH = 4
 
     def __init__(self, *args, **kwargs):
         self._particle_space = None
         self._uri = None
         self._index = -1
+        self._readers = {}
+        # held while readers and the uri are used, as both the worker
+        # thread and the GUI thread request data.
+        self._lock = threading.RLock()
+        # readers used by the prefetch thread only
+        self._prefetch_readers = {}
+        # frames are read as views into memory-mapped logs.
+        self.use_mmap = True
+        self.prefetcher = Prefetcher(
+            self.prefetch_particle_space, depth=self.PREFETCH_DEPTH)
         PipelineNode.__init__(self, *args, **kwargs)
 
+    def finalize(self):
+        """Finalizer.
+        """
+        self.prefetcher.close()
+        with self._lock:
+            self.close_readers()
+        for reader in self._prefetch_readers.values():
+            reader.close()
+        self._prefetch_readers.clear()
+        PipelineNode.finalize(self)
+
     @log_call
     def internal_update(self):
         """Reset cached spatiocyte data.
         """
         self._particle_space = None
+        self.prefetcher.clear()
+
+    def get_reader(self, filename):
+        """Returns a reader kept open for filename.
+        """
+        reader = self._readers.get(filename, None)
+        if reader is None:
+            reader = SpatiocyteLogReader(filename, use_mmap=self.use_mmap)
+            self._readers[filename] = reader
+        return reader
+
+    def close_readers(self):
+        """Closes all readers kept open.
+        """
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+
+    def get_filenames(self, uri):
+        """Returns log filenames matching the uri.
+        """
+        if uri is None:
+            return []
+        parsed = urlparse(uri)
+        fullpath = parsed.netloc + parsed.path
+        rexp = re.compile('(.+)\.dat$')
+        mobj = rexp.match(fullpath)
+        if mobj is None:
+            raise IOError, 'No suitable file.'
+        return glob.glob(fullpath)
+
+    def get_number_of_items(self, **kwargs):
+        """Returns the number of frames available in all matching logs.
+        """
+        uri = self.parent.request_data(UriSpec, **kwargs)
+        try:
+            filenames = self.get_filenames(uri)
+            if len(filenames) == 0:
+                return 0
+            with self._lock:
+                # pick up frames appended since the last request.
+                n_items = min(len(self.get_reader(filename).refreshIndex())
+                              for filename in filenames)
+            self.prefetcher.n_items = n_items
+            return n_items
+        except (IOError, SpatiocyteLogReadingException), e:
+            warning('Failed to index %s: %s', uri, str(e))
+            return 0
 
     def load_spatiocyte_file(self, fullpath, index):
         rexp = re.compile('(.+)\.dat$')
@@ -476,16 +823,60 @@ class ParticleSpatiocyteLoaderNode(PipelineNode):
 
         filenames = glob.glob(fullpath)
         if len(filenames) > 1:
-            dialog = ParticleSpatiocyteLoaderProgressDialog(filenames)
-            dialog.index = index
-            ps = dialog.Show()
-            dialog.Destroy()
+            ps = load_particles_from_spatiocyte_files(filenames, index)
         elif len(filenames) == 1:
-            ps = load_particles_from_spatiocyte(filenames[0],index)
+            try:
+                ps = self.get_reader(filenames[0]).skipSpeciesTo(index)
+            except SpatiocyteLogReadingException, e:
+                warning('Failed to read %s: %s', filenames[0], str(e))
+                ps = None
         else:
             ps = None
         return ps
 
+    def load_particle_space(self, index):
+        """Loads the frame at index of the current uri.
+        """
+        uri = self._uri
+        if uri is None:
+            return None
+        debug('spatiocyte data uri=%s' % uri)
+        parsed = urlparse(uri)
+        fullpath = parsed.netloc + parsed.path
+        try:
+            return self.load_spatiocyte_file(fullpath, index)
+        except IOError, e:
+            warning('Failed to open %s: %s', fullpath, str(e))
+            return None
+
+    def prefetch_particle_space(self, index):
+        """Loads the frame at index of the current uri on the prefetch thread.
+
+        This reads with readers of its own, as readers are not thread-safe,
+        and merges frames of multiple logs without a progress dialog.
+        """
+        filenames = self.get_filenames(self._uri)
+        for filename in self._prefetch_readers.keys():
+            if filename not in filenames:
+                self._prefetch_readers.pop(filename).close()
+        spaces = []
+        for filename in filenames:
+            reader = self._prefetch_readers.get(filename, None)
+            if reader is None:
+                reader = SpatiocyteLogReader(filename, use_mmap=self.use_mmap)
+                self._prefetch_readers[filename] = reader
+            try:
+                spaces.append(reader.skipSpeciesTo(index))
+            except SpatiocyteLogReadingException:
+                # not written yet
+                return None
+        if len(spaces) > 1:
+            offset_pids(spaces)
+            return merge_particle_spaces(spaces)
+        elif len(spaces) == 1:
+            return spaces[0]
+        return None
+
     def fetch_particle_space(self, **kwargs):
         """Property getter for particle_space
         """
@@ -497,25 +888,16 @@ class ParticleSpatiocyteLoaderNode(PipelineNode):
         else:
             index = 0
 
-        if not (self._uri == uri and self._index == index):
-            self._particle_space = None
-            self._uri = uri
-
-        if self._particle_space:
-            pass
-        else: # self._particle_space is None
-            if uri is None:
-                return
-
-            debug('spatiocyte data uri=%s' % uri)
+        with self._lock:
+            if self._uri != uri:
+                self.close_readers()
+                self.prefetcher.clear()
+                self._uri = uri
 
-            try:
-                parsed = urlparse(uri)
-                fullpath = parsed.netloc + parsed.path
-                self._particle_space = self.load_spatiocyte_file(fullpath, index)
-            except IOError, e:
-                warning('Failed to open %s: %s', fullpath, str(e))
-                pass
+            # frames next to index are loaded in background meanwhile.
+            self._particle_space = self.prefetcher.get(
+                index, self.load_particle_space)
+            self._index = index
 
         # self._particle_space is left None if something wrong in loading data.
         return self._particle_space
@@ -526,11 +908,8 @@ class ParticleSpatiocyteLoaderNode(PipelineNode):
         """
         if spec == NumberOfItemsSpec:
             debug('Serving NumberOfItemsSpec')
-            ps = self.fetch_particle_space(**kwargs)
-            if ps is None:
-                return 0
-            else:
-                return ps.getNumberOfItems()
+            # served from the frame index, no frame is loaded.
+            return self.get_number_of_items(**kwargs)
         elif spec == ParticleSpaceSpec:
             debug('Serving ParticleSpaceSpec')
             # this may be None if datasource is not valid.
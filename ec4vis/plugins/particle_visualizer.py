@@ -24,7 +24,7 @@ from ec4vis.plugins.particle_constructor import ParticlesSpec, SpeciesTableSpec,
 from ec4vis.visualizer.page import register_visualizer_page
 from ec4vis.visualizer.vtk3d import Vtk3dVisualizerNode
 from ec4vis.visualizer.vtk3d.page import Vtk3dVisualizerPage
-from ec4vis.visualizer.vtk3d.visual import ActorsVisual
+from ec4vis.visualizer.vtk3d.visual import ActorsVisual, create_points
 
 
 class ParticlesVisual(ActorsVisual):
@@ -46,14 +46,17 @@ class ParticlesVisual(ActorsVisual):
         """
         if (bool(self._actors_cache)==False and
             self.species_table and self.world_size and self.particles):
+            # one pass over particles, then one mask per species.
+            p_infos = self.particles.values()
+            species_ids = numpy.array([p_info['species_id'] for p_info in p_infos])
+            positions = numpy.array(
+                [p_info['position'] for p_info in p_infos], dtype=numpy.float64)
             for sp_id, info in self.species_table.items():
                 name = info['name']
                 radius = info['radius']
                 D = info['D']
-                points = vtk.vtkPoints()
-                for p_id, p_info in self.particles.items():
-                    if p_info['species_id']==sp_id:
-                        points.InsertNextPoint(p_info['position']*self.scaling/self.world_size)
+                points = create_points(
+                    positions[species_ids==sp_id] * self.scaling, self.world_size)
                 poly_data = vtk.vtkPolyData()
                 poly_data.SetPoints(points)
                 source = vtk.vtkSphereSource()
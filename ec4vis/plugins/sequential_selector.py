@@ -24,6 +24,8 @@ class SequentialHdf5SelectorNode(PipelineNode):
     """
     INPUT_SPEC = [Hdf5DataSpec, NumberOfItemsSpec]
     OUTPUT_SPEC = [Hdf5DataSpec]
+    SPEC_DEPENDENCIES = {
+        Hdf5DataSpec: ['index_cursor', Hdf5DataSpec, NumberOfItemsSpec]}
 
     def __init__(self, *args, **kwargs):
         self.index_cursor = 0
@@ -52,9 +54,10 @@ class SequentialHdf5SelectorNode(PipelineNode):
     @property
     @log_call
     def selected_data(self):
-        if self.index_cursor in range(-self.n_data, self.n_data):
-            debug("retriving data at index=%s" %self.index_cursor)
-            return self.parent.request_data(Hdf5DataSpec, index=self.index_cursor)
+        index_cursor = self.get_parameter('index_cursor')
+        if index_cursor in range(-self.n_data, self.n_data):
+            debug("retriving data at index=%s" %index_cursor)
+            return self.parent.request_data(Hdf5DataSpec, index=index_cursor)
         else:
             warning('Index cursor is set to wrong value.')
         return None
@@ -96,7 +99,7 @@ class SequentialHdf5SelectorInspector(InspectorPage):
     def OnCursorSpin(self, event):
         if self.target:
             self.target.index_cursor = self.cursor_spin.GetValue()
-        self.target.propagate_down(UpdateEvent(None))
+        self.target.schedule_notify_changed('index_cursor')
 
     def update(self):
         self.n_data.SetValue("%s" %self.target.n_data)
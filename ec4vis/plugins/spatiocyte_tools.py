@@ -4,6 +4,7 @@
 #
 
 from math import sqrt
+import numpy
 
 HCP_LATTICE = 0
 CUBIC_LATTICE = 1
@@ -44,3 +45,86 @@ def coord2global(coord, row_size, layer_size):
     point = (grow, glayer, gcol)
     return point
 
+def coord2global_array(coords, row_size, layer_size):
+    """
+    input : an array of coords, row_size, layer_size
+    output: a tuple of arrays (grow, glayer, gcol)
+    """
+    coords = numpy.asarray(coords, dtype=numpy.int64)
+    gcol = coords // (row_size * layer_size)
+    glayer = (coords % (row_size * layer_size)) // row_size
+    grow = (coords % (row_size * layer_size)) % row_size
+    return (grow, glayer, gcol)
+
+def coord2point_array(coords, row_size, layer_size, lattice_type=None):
+    """
+    input : an array of coords, row_size, layer_size
+    output: an (n, 3) array of points, same as coord2point for each coord
+
+    >>> import sys
+    >>> module = sys.modules[coord2point.__module__]
+    >>> coords = numpy.arange(3 * 4 * 5)
+    >>> for lattice_type in (HCP_LATTICE, CUBIC_LATTICE):
+    ...     module.latticeType = lattice_type
+    ...     expected = [coord2point(coord, 3, 4) for coord in coords]
+    ...     points = coord2point_array(coords, 3, 4, lattice_type)
+    ...     print lattice_type, points.shape, (points == expected).all()
+    0 (60, 3) True
+    1 (60, 3) True
+    >>> module.latticeType = HCP_LATTICE
+    """
+    if lattice_type is None:
+        lattice_type = latticeType
+    (grow, glayer, gcol) = coord2global_array(coords, row_size, layer_size)
+    points = numpy.empty((len(gcol), 3), dtype=numpy.float64)
+    if lattice_type == HCP_LATTICE:
+        points[:, 1] = (gcol % 2) * HCPl + HCPy * glayer
+        points[:, 2] = grow * 2 * NVR + ((glayer + gcol) % 2) * NVR
+        points[:, 0] = gcol * HCPx
+    elif lattice_type == CUBIC_LATTICE:
+        points[:, 1] = glayer * 2 * NVR
+        points[:, 2] = grow * 2 * NVR
+        points[:, 0] = gcol * 2 * NVR
+    else:
+        raise ValueError('Unknown lattice type %s' % lattice_type)
+    return points
+
+def benchmark(num_coords=1000000, row_size=97, layer_size=89):
+    """
+    compares coord2point and coord2point_array on random coords,
+    printing throughput of both.
+    """
+    import time
+    global latticeType
+    coords = numpy.random.randint(
+        0, row_size * layer_size * 83, num_coords).astype(numpy.uint32)
+    saved = latticeType
+    try:
+        for lattice_type in (HCP_LATTICE, CUBIC_LATTICE):
+            latticeType = lattice_type
+            start = time.time()
+            expected = numpy.array(
+                [coord2point(coord, row_size, layer_size)
+                 for coord in coords.tolist()])
+            scalar_time = time.time() - start
+            start = time.time()
+            points = coord2point_array(coords, row_size, layer_size)
+            array_time = time.time() - start
+            assert (points == expected).all()
+            print 'lattice type %d: coord2point %.3g coords/s, coord2point_array %.3g coords/s (x%.1f)' % (
+                lattice_type, num_coords / scalar_time,
+                num_coords / array_time, scalar_time / array_time)
+    finally:
+        latticeType = saved
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    args_parser = ArgumentParser(description='Runs doctests of this module.')
+    args_parser.add_argument(
+        '--benchmark', action='store_true',
+        help='times coord2point_array() against coord2point() instead')
+    if args_parser.parse_args().benchmark:
+        benchmark()
+    else:
+        from doctest import testmod, ELLIPSIS
+        testmod(optionflags=ELLIPSIS)
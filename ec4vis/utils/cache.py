@@ -0,0 +1,208 @@
+# coding: utf-8
+"""ec4vis.utils.cache --- Bounded LRU cache.
+"""
+import threading
+from collections import OrderedDict
+
+# this allows module-wise execution
+try:
+    import ec4vis
+except ImportError:
+    import sys, os
+    p = os.path.abspath(__file__); sys.path.insert(0, p[:p.rindex(os.sep+'ec4vis')])
+
+
+class LRUCache(object):
+    """Mapping which keeps least recently used items within bounds.
+
+    The cache holds at most max_items items whose sizes, as given by
+    sizeof(value), sum to max_bytes at most; None disables a bound.
+    on_evict(key, value) is called for each item removed by eviction,
+    clear() or discard(), e.g. to close file handles. An item larger
+    than max_bytes is not kept at all, and put() returns False for it
+    without calling on_evict: the caller still owns it. Lookups are
+    counted as hits or misses. Pinned keys are never evicted to make
+    room for others. The cache can be shared between threads.
+
+    >>> evicted = []
+    >>> cache = LRUCache(max_items=2, on_evict=lambda k, v: evicted.append(k))
+    >>> cache.put('a', 1)
+    True
+    >>> cache.put('b', 2)
+    True
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    True
+    >>> evicted, cache.keys()
+    (['b'], ['a', 'c'])
+    >>> cache.get('b') # None
+    >>> cache.hits, cache.misses, cache.evictions
+    (1, 1, 1)
+    >>> cache = LRUCache(max_bytes=10, sizeof=len)
+    >>> cache.put('a', 'x' * 4)
+    True
+    >>> cache.put('b', 'x' * 4)
+    True
+    >>> cache.put('c', 'x' * 4)
+    True
+    >>> cache.keys(), cache.nbytes
+    (['b', 'c'], 8)
+    >>> cache.put('d', 'x' * 11)
+    False
+    >>> 'd' in cache, cache.keys()
+    (False, ['b', 'c'])
+    >>> evicted = []
+    >>> cache = LRUCache(max_bytes=10, sizeof=len,
+    ...                  on_evict=lambda k, v: evicted.append(k))
+    >>> cache.put('a', 'x' * 11)
+    False
+    >>> evicted
+    []
+    >>> cache = LRUCache(max_items=2)
+    >>> cache.put('a', 1)
+    True
+    >>> cache.pin('a')
+    >>> cache.put('b', 2)
+    True
+    >>> cache.put('c', 3)
+    True
+    >>> cache.keys()
+    ['a', 'c']
+
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None,
+                 on_evict=None):
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self._pinned = set()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def keys(self):
+        """Returns keys from the least recently used.
+        """
+        with self._lock:
+            return self._items.keys()
+
+    def get(self, key, default=None):
+        """Returns the value for key and marks it most recently used.
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            value = self._items.pop(key)
+            self._items[key] = value
+            return value
+
+    def item_size(self, key):
+        """Returns the size of the item for key, or None if absent.
+        """
+        with self._lock:
+            return self._sizes.get(key, None)
+
+    def pin(self, key):
+        """Protects key, present or not, from eviction by other items.
+        """
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.discard(key)
+            self.shrink()
+
+    def peek(self, key, default=None):
+        """Returns the value for key without touching order or counters.
+        """
+        with self._lock:
+            return self._items.get(key, default)
+
+    def put(self, key, value):
+        """Stores value for key, evicting least recently used items.
+
+        Returns False if value is too large to be kept.
+        """
+        size = 0
+        if self.sizeof is not None:
+            size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                if self._items[key] is value:
+                    self._remove(key)
+                else:
+                    self._evict(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+            self._items[key] = value
+            self._sizes[key] = size
+            self.nbytes += size
+            self.shrink()
+            return True
+
+    def shrink(self):
+        """Evicts items until the cache is within its bounds.
+
+        Call this after changing max_items or max_bytes.
+        """
+        with self._lock:
+            while ((self.max_items is not None
+                    and len(self._items) > self.max_items)
+                   or (self.max_bytes is not None
+                       and self.nbytes > self.max_bytes)):
+                key = next((key for key in self._items
+                            if key not in self._pinned), None)
+                if key is None:
+                    # only pinned items are left.
+                    break
+                self.evictions += 1
+                self._evict(key)
+
+    def discard(self, key):
+        """Removes key if present.
+        """
+        with self._lock:
+            if key in self._items:
+                self._evict(key)
+
+    def clear(self):
+        """Removes all items.
+        """
+        with self._lock:
+            for key in self._items.keys():
+                self._evict(key)
+            self._pinned.clear()
+
+    def _remove(self, key):
+        value = self._items.pop(key)
+        self.nbytes -= self._sizes.pop(key)
+        return value
+
+    def _evict(self, key):
+        value = self._remove(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
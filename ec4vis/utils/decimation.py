@@ -0,0 +1,202 @@
+# coding: utf-8
+"""ec4vis.utils.decimation --- Reducing particles to a budget.
+
+Each function takes an (n, 3) array of positions and a budget, and
+returns a sorted array of at most budget indices of particles to keep.
+"""
+import numpy
+
+# this allows module-wise execution
+try:
+    import ec4vis
+except ImportError:
+    import sys, os
+    p = os.path.abspath(__file__); sys.path.insert(0, p[:p.rindex(os.sep+'ec4vis')])
+
+
+# fixed, so that the same particles are kept from frame to frame.
+DEFAULT_SEED = 0
+# refinements of the cell size in voxel_grid_indices().
+VOXEL_GRID_ITERATIONS = 6
+# particles per cell of the grid of density_preserving_indices().
+DENSITY_CELL_PARTICLES = 4
+
+
+def stride_indices(positions, budget):
+    """Keeps every k-th particle, in the order they are stored.
+
+    >>> stride_indices(numpy.zeros((10, 3)), 4).tolist()
+    [0, 3, 6, 9]
+
+    """
+    return numpy.arange(0, len(positions), len(positions) // budget + 1)
+
+
+def random_indices(positions, budget, seed=DEFAULT_SEED):
+    """Keeps budget particles drawn at random without replacement.
+
+    >>> random_indices(numpy.zeros((10, 3)), 4).shape
+    (4,)
+    >>> random_indices(numpy.zeros((3, 3)), 4).tolist()
+    [0, 1, 2]
+
+    """
+    n = len(positions)
+    if n <= budget:
+        return numpy.arange(n)
+    random_state = numpy.random.RandomState(seed)
+    return numpy.sort(random_state.permutation(n)[: budget])
+
+
+def _cell_keys(positions, lower, cell_size):
+    """Returns a flat integer key of the grid cell of each position.
+
+    Keys are made dense, from 0 to the number of keys, if the grid has
+    many more cells than particles.
+    """
+    cells = ((positions - lower) / cell_size).astype(numpy.int64)
+    shape = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * shape[1] + cells[:, 1]) * shape[2] + cells[:, 2]
+    if shape.prod() > 4 * len(keys):
+        keys = numpy.unique(keys, return_inverse=True)[1]
+    return keys
+
+
+def _cell_representatives(keys):
+    """Returns the index of one particle in each occupied cell, sorted.
+    """
+    first = numpy.empty(keys.max() + 1, dtype=numpy.int64)
+    first.fill(-1)
+    # one of the particles sharing a key is written last.
+    first[keys] = numpy.arange(len(keys))
+    return numpy.sort(first[first >= 0])
+
+
+def _grid(positions):
+    """Returns the lower corner and the longest edge of the bounding box.
+    """
+    lower = positions.min(axis=0)
+    size = (positions.max(axis=0) - lower).max()
+    return lower, max(size, numpy.finfo(numpy.float64).tiny)
+
+
+def voxel_grid_indices(positions, budget, max_iterations=VOXEL_GRID_ITERATIONS):
+    """Keeps one particle per cell of a grid sized to fit the budget.
+
+    The cell size is refined from the number of occupied cells, which
+    grows with cells per edge to the power of 1 for particles on lines,
+    2 on membranes and 3 in volumes.
+
+    >>> positions = numpy.array([[0.0, 0.0, 0.0], [0.1, 0.0, 0.0],
+    ...                          [1.0, 1.0, 1.0], [0.9, 1.0, 1.0]])
+    >>> [index // 2 for index in voxel_grid_indices(positions, 2)]
+    [0, 1]
+    >>> grid = numpy.mgrid[0:20, 0:20, 0:20].reshape((3, -1)).T
+    >>> 900 <= len(voxel_grid_indices(grid, 1000)) <= 1000
+    True
+
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3))
+    n = len(positions)
+    if n <= budget:
+        return numpy.arange(n)
+    lower, size = _grid(positions)
+    # first, as if particles filled the bounding box.
+    cells, dimension = budget ** (1.0 / 3), 3.0
+    best = indices = None
+    previous = None
+    for i in range(max_iterations):
+        indices = _cell_representatives(
+            _cell_keys(positions, lower, size / cells))
+        count = len(indices)
+        if count <= budget and (best is None or count > len(best)):
+            best = indices
+        if 0.9 * budget <= count <= budget:
+            break
+        if previous is not None and previous[1] != count and previous[0] != cells:
+            dimension = numpy.log(float(count) / previous[1]) / numpy.log(cells / previous[0])
+            dimension = min(max(dimension, 1.0), 3.0)
+        previous = (cells, count)
+        cells *= (float(budget) / count) ** (1.0 / dimension)
+    if best is None:
+        # still too many cells, thin them out.
+        best = indices[stride_indices(indices, budget)]
+    return best
+
+
+def density_preserving_indices(positions, budget, seed=DEFAULT_SEED):
+    """Keeps particles at random, in proportion to each cell of a grid.
+
+    Each particle is kept with the probability to keep round(budget / n)
+    of its cell, at least one. Dense regions stay denser than sparse
+    ones, and no occupied cell is left empty, unlike random_indices()
+    which may drop sparse regions. Particles over the budget are dropped
+    from those kept besides one per cell; for very small budgets with
+    more occupied cells than the budget, cells are dropped at random.
+
+    >>> positions = numpy.concatenate([numpy.zeros((99, 3)), [[1.0, 1.0, 1.0]]])
+    >>> indices = density_preserving_indices(positions, 10)
+    >>> len(indices) <= 10, 99 in indices
+    (True, True)
+    >>> grid = numpy.mgrid[0:8, 0:8, 0:8].reshape((3, -1)).T
+    >>> positions = numpy.concatenate([grid, numpy.zeros((5000, 3))])
+    >>> len(density_preserving_indices(positions, 100))
+    100
+    >>> len(density_preserving_indices(positions, 4))
+    4
+
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3))
+    n = len(positions)
+    if n <= budget:
+        return numpy.arange(n)
+    lower, size = _grid(positions)
+    cells = max(budget // DENSITY_CELL_PARTICLES, 1) ** (1.0 / 3)
+    keys = _cell_keys(positions, lower, size / cells)
+    random_state = numpy.random.RandomState(seed)
+    priorities = random_state.random_sample(n)
+    counts = numpy.bincount(keys)
+    quotas = numpy.maximum(numpy.round(counts * (float(budget) / n)), 1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratios = quotas / counts
+    keep = priorities < ratios[keys]
+    representatives = _cell_representatives(keys)
+    if len(representatives) >= budget:
+        kept = representatives[
+            numpy.argsort(priorities[representatives])[: budget]]
+        return numpy.sort(kept)
+    keep[representatives] = False
+    others = numpy.flatnonzero(keep)
+    room = budget - len(representatives)
+    if len(others) > room:
+        # rounding up quotas may exceed the budget by a little.
+        others = others[numpy.argsort(priorities[others])[: room]]
+    return numpy.sort(numpy.concatenate([representatives, others]))
+
+
+DECIMATION_FUNCTIONS = {
+    'stride': stride_indices,
+    'random': random_indices,
+    'voxel grid': voxel_grid_indices,
+    'density preserving': density_preserving_indices,
+    }
+DECIMATION_MODES = ['stride', 'random', 'voxel grid', 'density preserving']
+
+
+def decimate(mode, positions, budget):
+    """Returns indices of at most budget particles to keep, by mode.
+
+    >>> decimate('stride', numpy.zeros((10, 3)), 4).tolist()
+    [0, 3, 6, 9]
+    >>> decimate('voxel grid', numpy.zeros((3, 3)), 4).tolist()
+    [0, 1, 2]
+
+    """
+    if mode not in DECIMATION_FUNCTIONS:
+        raise ValueError('Unknown decimation mode %s' % mode)
+    return DECIMATION_FUNCTIONS[mode](positions, budget)
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
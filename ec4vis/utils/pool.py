@@ -0,0 +1,95 @@
+# coding: utf-8
+"""ec4vis.utils.pool --- Running loaders in a process pool.
+"""
+import multiprocessing
+
+# this allows module-wise execution
+try:
+    import ec4vis
+except ImportError:
+    import sys, os
+    p = os.path.abspath(__file__); sys.path.insert(0, p[:p.rindex(os.sep+'ec4vis')])
+
+
+# seconds to wait for the next result before reporting progress again.
+POLL_INTERVAL = 0.1
+# worker processes shared by all callers, see start_process_pool().
+PROCESS_POOL = None
+
+
+def start_process_pool(processes=None):
+    """Starts the worker processes used by map_in_pool(), if not yet.
+
+    Call this at startup, before any thread is started: a process forked
+    while another thread holds a lock inherits the lock held forever.
+    processes defaults to the number of CPUs. Returns the pool.
+    """
+    global PROCESS_POOL
+    if PROCESS_POOL is None:
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        PROCESS_POOL = multiprocessing.Pool(processes)
+    return PROCESS_POOL
+
+
+def stop_process_pool():
+    """Terminates the worker processes started by start_process_pool().
+    """
+    global PROCESS_POOL
+    if PROCESS_POOL is not None:
+        PROCESS_POOL.terminate()
+        PROCESS_POOL.join()
+        PROCESS_POOL = None
+
+
+def map_in_pool(function, args, progress=None, processes=None):
+    """Applies function to each of args in worker processes.
+
+    Returns the list of results in the order of args. function must be
+    a module-level function, so that it can be pickled. progress is
+    called as progress(count) with the number of results received so
+    far while waiting; None is returned once it returns False, and
+    results still being computed are dropped. An exception raised in a
+    worker is raised again.
+
+    The workers are those of start_process_pool(). If processes is 0,
+    or this is itself a daemonic worker process, which may not have
+    children, function is applied in this process instead.
+
+    >>> map_in_pool(abs, [-1, 2, -3])
+    [1, 2, 3]
+    >>> map_in_pool(abs, [-1, 2, -3], progress=lambda count: False) # None
+    >>> map_in_pool(abs, [])
+    []
+    >>> counts = []
+    >>> map_in_pool(abs, [-1, 2], counts.append, processes=0), counts
+    (None, [1])
+    >>> map_in_pool(abs, [-1, 2], lambda count: True, processes=0)
+    [1, 2]
+
+    """
+    args = list(args)
+    if len(args) == 0:
+        return []
+    if processes == 0 or multiprocessing.current_process().daemon:
+        results = []
+        for arg in args:
+            results.append(function(arg))
+            if progress is not None and not progress(len(results)):
+                return None
+        return results
+    iterator = start_process_pool().imap(function, args)
+    results = []
+    while len(results) < len(args):
+        try:
+            results.append(iterator.next(POLL_INTERVAL))
+        except multiprocessing.TimeoutError:
+            pass
+        if progress is not None and not progress(len(results)):
+            return None
+    return results
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
@@ -0,0 +1,192 @@
+# coding: utf-8
+"""ec4vis.utils.prefetch --- Background prefetch of sequential items.
+"""
+import threading
+
+# this allows module-wise execution
+try:
+    import ec4vis
+except ImportError:
+    import sys, os
+    p = os.path.abspath(__file__); sys.path.insert(0, p[:p.rindex(os.sep+'ec4vis')])
+
+from ec4vis.logger import debug, warning
+from ec4vis.utils.cache import LRUCache
+
+
+class Prefetcher(object):
+    """Loads items next to the requested index on a worker thread.
+
+    get(index, load) returns the item at index from the cache, or loads
+    it by load(index) in the calling thread. It then schedules up to
+    depth items ahead in the direction the index last moved, and one
+    behind, to be loaded by prefetch(index) on the worker thread. The
+    two loaders are given separately, so that each thread can use its
+    own file handles. Either returns None for an item not available.
+
+    The item last asked for is pinned in the cache, so that items
+    prefetched never evict it while the caller uses it. Prefetching is
+    limited to as many items as the cache bounds leave room for besides
+    it, counting its size for each when the cache is bounded in bytes.
+
+    >>> prefetcher = Prefetcher(lambda index: index * 10, depth=2)
+    >>> prefetcher.n_items = 10
+    >>> prefetcher.get(3, lambda index: index * 10)
+    30
+    >>> prefetcher.wait()
+    >>> sorted(prefetcher.cache.keys())
+    [2, 3, 4, 5]
+    >>> prefetcher.get(2, lambda index: None)
+    20
+    >>> prefetcher.wait()
+    >>> sorted(prefetcher.cache.keys())
+    [0, 1, 2, 3, 4, 5]
+    >>> prefetcher.close()
+    >>> closed = []
+    >>> cache = LRUCache(max_bytes=30, sizeof=lambda item: 10,
+    ...                  on_evict=lambda index, item: closed.append(index))
+    >>> prefetcher = Prefetcher(lambda index: index, depth=4, cache=cache)
+    >>> prefetcher.get(0, lambda index: index)
+    0
+    >>> prefetcher.wait()
+    >>> sorted(cache.keys()), closed
+    ([0, 1, 2], [])
+    >>> prefetcher.close()
+
+    """
+
+    def __init__(self, prefetch, depth=2, cache=None):
+        self.prefetch = prefetch
+        self.depth = depth
+        if cache is None:
+            cache = LRUCache(max_items=2 * depth + 2)
+        self.cache = cache
+        # number of items, to bound prefetching. None if unknown.
+        self.n_items = None
+        self._last_index = None
+        self._direction = 1
+        self._pending = []
+        self._loading = None
+        # index pinned in the cache
+        self._pinned = None
+        # bumped by clear(), to drop items loaded before it.
+        self._generation = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def get(self, index, load):
+        """Returns the item at index and schedules its neighbours.
+        """
+        with self._condition:
+            # wait for the worker instead of loading the same item twice.
+            while self._loading == index:
+                self._condition.wait()
+            if index in self._pending:
+                self._pending.remove(index)
+            generation = self._generation
+            if self._pinned != index:
+                if self._pinned is not None:
+                    self.cache.unpin(self._pinned)
+                self.cache.pin(index)
+                self._pinned = index
+        item = self.cache.get(index)
+        if item is None:
+            item = load(index)
+            if item is not None:
+                with self._condition:
+                    if generation == self._generation:
+                        self.cache.put(index, item)
+        self.schedule(index)
+        return item
+
+    def schedule(self, index):
+        """Plans prefetching around index, replacing earlier plans.
+        """
+        if self._last_index is not None and index != self._last_index:
+            self._direction = 1 if index > self._last_index else -1
+        self._last_index = index
+        direction = self._direction
+        candidates = [index + direction * step
+                      for step in range(1, self.depth + 1)]
+        candidates.append(index - direction)
+        if self.cache.max_items is not None:
+            # room besides the item at index.
+            candidates = candidates[: max(self.cache.max_items - 1, 0)]
+        size = self.cache.item_size(index)
+        if self.cache.max_bytes is not None and size:
+            # assuming neighbours are about as large as the item at index.
+            candidates = candidates[: max(self.cache.max_bytes // size - 1, 0)]
+        pending = [i for i in candidates
+                   if i >= 0 and (self.n_items is None or i < self.n_items)
+                   and i not in self.cache]
+        with self._condition:
+            self._pending = pending
+            if pending and self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify_all()
+
+    def wait(self):
+        """Blocks until scheduled items are loaded.
+        """
+        with self._condition:
+            while self._pending or self._loading is not None:
+                self._condition.wait()
+
+    def clear(self):
+        """Drops cached and scheduled items, e.g. when the source changed.
+        """
+        with self._condition:
+            self._generation += 1
+            self._pending = []
+            self._last_index = None
+            self._pinned = None
+            self.cache.clear()
+
+    def close(self):
+        """Stops the worker thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._pending = []
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                index = self._pending.pop(0)
+                if index in self.cache:
+                    continue
+                self._loading = index
+                generation = self._generation
+            item = None
+            try:
+                debug('prefetching index=%s' % index)
+                item = self.prefetch(index)
+            except Exception, e:
+                warning('Failed to prefetch index=%s: %s', index, str(e))
+            with self._condition:
+                if item is None:
+                    pass
+                elif (generation != self._generation
+                      or not self.cache.put(index, item)):
+                    # loaded before clear(), e.g. from an old source, or
+                    # too large to keep. nobody else holds it.
+                    if self.cache.on_evict is not None:
+                        self.cache.on_evict(index, item)
+                self._loading = None
+                self._condition.notify_all()
+
+
+if __name__=='__main__':
+    from doctest import testmod, ELLIPSIS
+    testmod(optionflags=ELLIPSIS)
@@ -11,7 +11,40 @@ accroding to specific visualization needs.
 
 """
 from collections import OrderedDict
+import numpy
 import vtk
+from vtk.util import numpy_support
+
+
+def create_points(positions, scale=1.0):
+    """Returns vtkPoints for an (n, 3) array of positions divided by scale.
+
+    The points hold a float64 copy of the array, built at once with no
+    per-point calls into VTK.
+    """
+    return update_points(vtk.vtkPoints(), positions, scale)
+
+
+def update_points(points, positions, scale=1.0):
+    """Replaces the data of vtkPoints as create_points() does.
+
+    The points are marked modified, so that pipelines using them are
+    executed again on the next render. Returns points.
+    """
+    array = numpy.asarray(positions, dtype=numpy.float64).reshape((-1, 3))
+    array = numpy.ascontiguousarray(array / scale)
+    # copied, as numpy_to_vtk does not keep array alive with deep=0.
+    points.SetData(numpy_support.numpy_to_vtk(array, deep=1))
+    points.Modified()
+    return points
+
+
+def create_array(values, name):
+    """Returns a vtk data array named name for a copy of a 1-d numpy array.
+    """
+    array = numpy_support.numpy_to_vtk(numpy.ascontiguousarray(values), deep=1)
+    array.SetName(name)
+    return array
 
 
 class Visual(object):